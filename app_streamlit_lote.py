@@ -1,8 +1,12 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import altair as alt
 import time
 import io
-from batch_processor import BatchAbsolutionAnalyzer
+import math
+import codecs
+from batch_processor import BatchAbsolutionAnalyzer, BigDataCache
 from datetime import datetime
 
 # Configuração da página
@@ -14,6 +18,109 @@ st.set_page_config(
 
 st.title("📊 Análise de Absolvição em Lote - Themis")
 
+# Quantidade de CPFs exibidos por página nos detalhes das absolvições
+DETAILS_PAGE_SIZE = 25
+
+# Rótulos da coluna "Foi Absolvido" (índice = código da categoria)
+STATUS_LABELS = ['❌ Não', '✅ Sim', '❓ Sem dados']
+STATUS_FILTER_CODES = {
+    'Apenas Não Absolvidos': 0,
+    'Apenas Absolvidos': 1,
+    'Apenas Sem Dados': 2
+}
+
+# Funções com cache (recalculadas apenas quando os argumentos mudam)
+# Listas de CPFs são dados pessoais: poucos uploads guardados em disco, apagados pelo botão de limpar cache
+@st.cache_data(persist='disk', max_entries=20, show_spinner=False)
+def _parse_upload(data, file_type):
+    """Extrair os CPFs válidos do arquivo enviado (cache pelo conteúdo do arquivo)"""
+    if file_type == "text/csv":
+        # Processar CSV (como texto, preservando zeros à esquerda dos CPFs)
+        df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+        if 'CPF' in df.columns:
+            cpf_series = df['CPF']
+        else:
+            # Se não tem cabeçalho CPF, usar primeira coluna
+            cpf_series = df.iloc[:, 0]
+    else:
+        # Processar TXT (linhas em bytes; CPFs são ASCII, decodificados linha a linha)
+        raw = data.removeprefix(codecs.BOM_UTF8)
+        cpf_series = pd.Series([line.strip().decode('ascii', 'ignore') for line in raw.splitlines() if line.strip()], dtype=object)
+    
+    # Limpar CPFs inválidos (vetorizado)
+    cpf_series = cpf_series.astype(str)
+    cpf_limpo = cpf_series.str.replace('.', '', regex=False).str.replace('-', '', regex=False)
+    return cpf_series[cpf_limpo.str.len() >= 11].tolist()
+
+@st.cache_data(show_spinner=False)
+def _compute_stats(results):
+    """Estatísticas resumidas dos resultados"""
+    return BatchAbsolutionAnalyzer.get_summary_stats(results)
+
+@st.cache_data(show_spinner=False)
+def _build_name_index(names):
+    """Nomes (já em minúsculas) concatenados em um único texto + offset de início de cada linha"""
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(names.str.len().to_numpy() + 1, out=offsets[1:])
+    return "\n".join(names), offsets
+
+def _match_names(names_joined, offsets, needle):
+    """Máscara das linhas cujo nome contém `needle`
+    
+    Cada busca é um str.find (em C) sobre o texto inteiro; após um acerto, a busca
+    continua a partir da próxima linha, então o laço em Python roda uma vez por linha
+    encontrada e não uma vez por linha da tabela.
+    """
+    mask = np.zeros(len(offsets) - 1, dtype=bool)
+    pos = names_joined.find(needle)
+    while pos != -1:
+        row = int(np.searchsorted(offsets, pos, side='right')) - 1
+        mask[row] = True
+        pos = names_joined.find(needle, int(offsets[row + 1]))
+    return mask
+
+@st.cache_data(show_spinner=False)
+def _filter_df(results_df, status_filter, name_filter):
+    """Aplicar filtros de resultado e nome à tabela de resultados"""
+    mask = np.ones(len(results_df), dtype=bool)
+    
+    status_code = STATUS_FILTER_CODES.get(status_filter)
+    if status_code is not None:
+        mask &= results_df['Foi Absolvido'].cat.codes.to_numpy() == status_code
+    
+    if name_filter:
+        names_joined, offsets = _build_name_index(results_df['_nome_lc'])
+        mask &= _match_names(names_joined, offsets, name_filter.lower())
+    
+    return results_df[mask].drop(columns='_nome_lc')
+
+@st.cache_data(show_spinner=False)
+def _build_chart(totals):
+    """Gráfico de barras da distribuição (absolvidos, não absolvidos, sem dados)"""
+    chart_data = pd.DataFrame({
+        'Status': ['Absolvidos', 'Não Absolvidos', 'Sem Dados'],
+        'Quantidade': list(totals)
+    })
+    return alt.Chart(chart_data).mark_bar().encode(x=alt.X('Status', sort=None), y='Quantidade')
+
+@st.cache_resource
+def _get_response_cache():
+    """Cache das respostas da BigData (SQLite), compartilhado entre sessões e reruns"""
+    return BigDataCache()
+
+def _format_absolution_detail(i, detalhe):
+    """Markdown de uma absolvição encontrada"""
+    return (
+        f"**Absolvição #{i}:**\n"
+        f"- **Processo:** {detalhe.get('processo', 'N/A')}\n"
+        f"- **Tipo:** {detalhe.get('tipo_decisao', 'N/A')}\n"
+        f"- **Órgão:** {detalhe.get('orgao', 'N/A')}\n"
+        f"- **Comarca:** {detalhe.get('comarca', 'N/A')}\n"
+        f"- **Data:** {detalhe.get('data', 'N/A')}\n\n"
+        f"**Trecho da decisão:**\n"
+        f"> {detalhe.get('trecho_decisao', 'N/A')}"
+    )
+
 # Sidebar com informações
 st.sidebar.markdown("""
 ### ℹ️ Como usar:
@@ -57,21 +164,7 @@ cpfs_to_analyze = []
 
 if uploaded_file is not None:
     try:
-        if uploaded_file.type == "text/csv":
-            # Processar CSV
-            df = pd.read_csv(uploaded_file)
-            if 'CPF' in df.columns:
-                cpfs_to_analyze = df['CPF'].astype(str).tolist()
-            else:
-                # Se não tem cabeçalho CPF, usar primeira coluna
-                cpfs_to_analyze = df.iloc[:, 0].astype(str).tolist()
-        else:
-            # Processar TXT
-            content = uploaded_file.read().decode('utf-8-sig')
-            cpfs_to_analyze = [line.strip() for line in content.split('\n') if line.strip()]
-        
-        # Limpar CPFs inválidos
-        cpfs_to_analyze = [cpf for cpf in cpfs_to_analyze if len(cpf.replace('.', '').replace('-', '')) >= 11]
+        cpfs_to_analyze = _parse_upload(uploaded_file.getvalue(), uploaded_file.type)
         
         st.success(f"✅ {len(cpfs_to_analyze)} CPFs carregados com sucesso!")
         
@@ -90,8 +183,10 @@ if uploaded_file is not None:
         st.error(f"Erro ao processar arquivo: {str(e)}")
         cpfs_to_analyze = []
 
-# Configurações da análise
-if cpfs_to_analyze:
+# Configurações da análise (fragmento: mexer nos sliders reexecuta apenas este painel;
+# os valores escolhidos ficam em st.session_state pelas chaves dos widgets)
+@st.fragment
+def _config_panel(total_cpfs):
     st.header("⚙️ Configurações da Análise")
     
     col1, col2 = st.columns(2)
@@ -102,6 +197,7 @@ if cpfs_to_analyze:
             min_value=1, 
             max_value=20, 
             value=10,
+            key="max_workers",
             help="Mais threads = mais rápido, mas pode sobrecarregar a API"
         )
     
@@ -112,12 +208,23 @@ if cpfs_to_analyze:
             max_value=2.0, 
             value=0.1, 
             step=0.1,
+            key="delay",
             help="Delay maior = mais lento, mas evita rate limiting"
         )
     
     # Estimativa de tempo
-    estimated_time = (len(cpfs_to_analyze) / max_workers) * delay
+    estimated_time = (total_cpfs / max_workers) * delay
     st.info(f"⏱️ Tempo estimado: {estimated_time:.1f} segundos ({estimated_time/60:.1f} minutos)")
+    
+    if st.button("🗑️ Limpar cache de resultados", help="Força nova consulta de CPFs já analisados anteriormente e apaga os uploads guardados em disco"):
+        _get_response_cache().clear()
+        _parse_upload.clear()
+        st.success("Cache de resultados limpo!")
+
+if cpfs_to_analyze:
+    _config_panel(len(cpfs_to_analyze))
+    max_workers = st.session_state.max_workers
+    delay = st.session_state.delay
 
 # Botão para iniciar análise
 if cpfs_to_analyze and st.button("🚀 Iniciar Análise", type="primary"):
@@ -129,9 +236,16 @@ if cpfs_to_analyze and st.button("🚀 Iniciar Análise", type="primary"):
         # Inicializar analisador
         analyzer = BatchAbsolutionAnalyzer(
             max_workers=max_workers,
-            delay_between_requests=delay
+            delay_between_requests=delay,
+            response_cache=_get_response_cache()
         )
         
+        # Remover CPFs duplicados antes de consultar a API (ordem preservada)
+        unique_cpfs = list(dict.fromkeys(cpfs_to_analyze))
+        duplicates = len(cpfs_to_analyze) - len(unique_cpfs)
+        if duplicates:
+            st.info(f"ℹ️ {duplicates} CPFs duplicados ignorados na consulta")
+        
         # Containers para mostrar progresso
         progress_container = st.container()
         results_container = st.container()
@@ -145,7 +259,7 @@ if cpfs_to_analyze and st.button("🚀 Iniciar Análise", type="primary"):
             
             # Contadores em tempo real
             with stats_cols[0]:
-                total_metric = st.metric("Total", len(cpfs_to_analyze))
+                total_metric = st.metric("Total", len(unique_cpfs))
             with stats_cols[1]:
                 processed_metric = st.metric("Processados", 0)
             with stats_cols[2]:
@@ -153,19 +267,30 @@ if cpfs_to_analyze and st.button("🚀 Iniciar Análise", type="primary"):
             with stats_cols[3]:
                 percentage_metric = st.metric("Progresso", "0%")
         
+        # Contador incremental de absolvidos (atualizado a cada resultado)
+        absolvidos_count = [0]
+        
+        # Limitar a frequência de atualização da interface (no máximo a cada 100 ms)
+        last_update = [0.0]
+        
         # Função de callback para atualizar progresso
         def update_progress(processed, total, result):
+            # Contar absolvidos até agora
+            if result.get('foi_absolvido') is True:
+                absolvidos_count[0] += 1
+            
+            now = time.monotonic()
+            if processed != total and now - last_update[0] < 0.1:
+                return
+            last_update[0] = now
+            
             progress = processed / total
             progress_bar.progress(progress)
             status_text.text(f"Processando CPF {processed}/{total}: {result['cpf']}")
             
-            # Contar absolvidos até agora
-            absolvidos_count = sum(1 for i in range(len(st.session_state.get('current_results', []))) 
-                                 if st.session_state.current_results[i].get('foi_absolvido') is True)
-            
             # Atualizar métricas
             processed_metric.metric("Processados", processed)
-            absolved_metric.metric("Absolvidos", absolvidos_count)
+            absolved_metric.metric("Absolvidos", absolvidos_count[0])
             percentage_metric.metric("Progresso", f"{progress*100:.1f}%")
         
         # Inicializar session state para resultados
@@ -176,7 +301,12 @@ if cpfs_to_analyze and st.button("🚀 Iniciar Análise", type="primary"):
         start_time = time.time()
         
         try:
-            results = analyzer.process_batch(cpfs_to_analyze, progress_callback=update_progress)
+            # Respostas já consultadas vêm do cache da BigData; a análise é sempre refeita
+            results = analyzer.process_batch(unique_cpfs, progress_callback=update_progress)
+            
+            # Reexpandir para a lista original (duplicatas recebem o mesmo resultado)
+            by_cpf = {r['cpf']: r for r in results}
+            results = [by_cpf[cpf] for cpf in cpfs_to_analyze]
             st.session_state.current_results = results
             
             end_time = time.time()
@@ -190,16 +320,14 @@ if cpfs_to_analyze and st.button("🚀 Iniciar Análise", type="primary"):
             st.error(f"❌ Erro durante a análise: {str(e)}")
             st.session_state.current_results = []
 
-# Mostrar resultados se existirem
-if 'current_results' in st.session_state and st.session_state.current_results:
-    results = st.session_state.current_results
-    
+# Mostrar resultados (fragmento: interações com filtros reexecutam apenas esta seção)
+@st.fragment
+def _results_view(results):
     with st.container():
         st.header("📊 Resultados da Análise")
         
         # Calcular estatísticas
-        analyzer = BatchAbsolutionAnalyzer()
-        stats = analyzer.get_summary_stats(results)
+        stats = _compute_stats(results)
         
         # Mostrar estatísticas
         st.subheader("📈 Estatísticas Gerais")
@@ -243,33 +371,32 @@ if 'current_results' in st.session_state and st.session_state.current_results:
         # Gráfico de pizza
         st.subheader("📊 Distribuição dos Resultados")
         
-        chart_data = pd.DataFrame({
-            'Status': ['Absolvidos', 'Não Absolvidos', 'Sem Dados'],
-            'Quantidade': [
-                stats['total_absolvidos'],
-                stats['total_nao_absolvidos'],
-                stats['total_sem_dados']
-            ]
-        })
+        chart = _build_chart((
+            stats['total_absolvidos'],
+            stats['total_nao_absolvidos'],
+            stats['total_sem_dados']
+        ))
         
-        st.bar_chart(chart_data.set_index('Status'))
+        st.altair_chart(chart, use_container_width=True)
         
         # Tabela de resultados
         st.subheader("📋 Resultados Detalhados")
         
-        # Preparar dados para tabela
-        table_data = []
-        for result in results:
-            table_data.append({
-                'CPF': result['cpf'],
-                'Nome': result['nome'],
-                'Foi Absolvido': '✅ Sim' if result['foi_absolvido'] is True else ('❌ Não' if result['foi_absolvido'] is False else '❓ Sem dados'),
-                'Total Processos Criminais': result['total_processos_criminais'],
-                'Total Absolvições': result['total_absolvicoes'],
-                'Status': result['status']
-            })
+        # Montar DataFrame único reaproveitado na tabela e nos downloads
+        base_df = pd.DataFrame(results)
+        absolvido_col = base_df['foi_absolvido']
         
-        results_df = pd.DataFrame(table_data)
+        results_df = base_df.rename(columns={
+            'cpf': 'CPF',
+            'nome': 'Nome',
+            'total_processos_criminais': 'Total Processos Criminais',
+            'total_absolvicoes': 'Total Absolvições',
+            'status': 'Status'
+        })
+        status_codes = np.select([absolvido_col.eq(True), absolvido_col.eq(False)], [1, 0], default=2)
+        results_df['Foi Absolvido'] = pd.Categorical.from_codes(status_codes, categories=STATUS_LABELS)
+        results_df['_nome_lc'] = results_df['Nome'].str.lower()
+        results_df = results_df[['CPF', 'Nome', 'Foi Absolvido', 'Total Processos Criminais', 'Total Absolvições', 'Status', '_nome_lc']]
         
         # Filtros
         col1, col2 = st.columns(2)
@@ -284,17 +411,7 @@ if 'current_results' in st.session_state and st.session_state.current_results:
             name_filter = st.text_input("Filtrar por nome:", placeholder="Digite parte do nome...")
         
         # Aplicar filtros
-        filtered_df = results_df.copy()
-        
-        if status_filter == 'Apenas Absolvidos':
-            filtered_df = filtered_df[filtered_df['Foi Absolvido'] == '✅ Sim']
-        elif status_filter == 'Apenas Não Absolvidos':
-            filtered_df = filtered_df[filtered_df['Foi Absolvido'] == '❌ Não']
-        elif status_filter == 'Apenas Sem Dados':
-            filtered_df = filtered_df[filtered_df['Foi Absolvido'] == '❓ Sem dados']
-        
-        if name_filter:
-            filtered_df = filtered_df[filtered_df['Nome'].str.contains(name_filter, case=False, na=False)]
+        filtered_df = _filter_df(results_df, status_filter, name_filter)
         
         st.dataframe(
             filtered_df,
@@ -306,28 +423,22 @@ if 'current_results' in st.session_state and st.session_state.current_results:
         st.subheader("💾 Download dos Resultados")
         
         # Preparar CSV para download
-        csv_data = []
-        for result in results:
-            csv_data.append({
-                'CPF': result['cpf'],
-                'Nome': result['nome'],
-                'Foi_Absolvido': result['foi_absolvido'],
-                'Total_Processos_Criminais': result['total_processos_criminais'],
-                'Total_Absolvicoes': result['total_absolvicoes'],
-                'Status': result['status']
-            })
-        
-        csv_df = pd.DataFrame(csv_data)
-        csv_buffer = io.StringIO()
-        csv_df.to_csv(csv_buffer, index=False, encoding='utf-8-sig')
-        csv_string = csv_buffer.getvalue()
+        csv_df = base_df.rename(columns={
+            'cpf': 'CPF',
+            'nome': 'Nome',
+            'foi_absolvido': 'Foi_Absolvido',
+            'total_processos_criminais': 'Total_Processos_Criminais',
+            'total_absolvicoes': 'Total_Absolvicoes',
+            'status': 'Status'
+        })[['CPF', 'Nome', 'Foi_Absolvido', 'Total_Processos_Criminais', 'Total_Absolvicoes', 'Status']]
+        csv_bytes = csv_df.to_csv(index=False).encode('utf-8-sig')
         
         col1, col2 = st.columns(2)
         
         with col1:
             st.download_button(
                 label="📥 Baixar Resultados Completos (CSV)",
-                data=csv_string,
+                data=csv_bytes,
                 file_name=f"analise_absolvicoes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                 mime="text/csv",
                 help="Download com todos os resultados da análise"
@@ -335,39 +446,40 @@ if 'current_results' in st.session_state and st.session_state.current_results:
         
         with col2:
             # CSV apenas dos absolvidos
-            absolved_df = csv_df[csv_df['Foi_Absolvido'] == True]
+            absolved_df = csv_df.loc[absolvido_col.eq(True)]
             if len(absolved_df) > 0:
-                csv_buffer_abs = io.StringIO()
-                absolved_df.to_csv(csv_buffer_abs, index=False, encoding='utf-8-sig')
-                csv_string_abs = csv_buffer_abs.getvalue()
+                csv_bytes_abs = absolved_df.to_csv(index=False).encode('utf-8-sig')
                 
                 st.download_button(
                     label="📥 Baixar Apenas Absolvidos (CSV)",
-                    data=csv_string_abs,
+                    data=csv_bytes_abs,
                     file_name=f"apenas_absolvidos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                     mime="text/csv",
                     help="Download apenas dos CPFs que foram absolvidos"
                 )
         
-        # Detalhes expandidos
+        # Detalhes expandidos (paginados para não renderizar todos os CPFs de uma vez)
         if st.checkbox("🔍 Mostrar detalhes das absolvições"):
             st.subheader("📜 Detalhes das Absolvições")
             
-            for result in results:
-                if result['foi_absolvido'] and result['detalhes_absolvicoes']:
-                    with st.expander(f"🔍 {result['nome']} ({result['cpf']})"):
-                        for i, detalhe in enumerate(result['detalhes_absolvicoes'], 1):
-                            st.markdown(f"""
-                            **Absolvição #{i}:**
-                            - **Processo:** {detalhe.get('processo', 'N/A')}
-                            - **Tipo:** {detalhe.get('tipo_decisao', 'N/A')}
-                            - **Órgão:** {detalhe.get('orgao', 'N/A')}
-                            - **Comarca:** {detalhe.get('comarca', 'N/A')}
-                            - **Data:** {detalhe.get('data', 'N/A')}
-                            
-                            **Trecho da decisão:**
-                            > {detalhe.get('trecho_decisao', 'N/A')}
-                            """)
+            absolved_results = [r for r in results if r['foi_absolvido'] and r['detalhes_absolvicoes']]
+            total_pages = max(1, math.ceil(len(absolved_results) / DETAILS_PAGE_SIZE))
+            page = st.number_input("Página", min_value=1, max_value=total_pages, value=1, step=1)
+            
+            start = (page - 1) * DETAILS_PAGE_SIZE
+            for result in absolved_results[start:start + DETAILS_PAGE_SIZE]:
+                with st.expander(f"🔍 {result['nome']} ({result['cpf']})"):
+                    st.markdown("\n\n".join([
+                        _format_absolution_detail(i, detalhe)
+                        for i, detalhe in enumerate(result['detalhes_absolvicoes'], 1)
+                    ]))
+            
+            if total_pages > 1:
+                st.info(f"Página {page} de {total_pages}. Total de CPFs com absolvição: {len(absolved_results)}")
+
+# Mostrar resultados se existirem
+if 'current_results' in st.session_state and st.session_state.current_results:
+    _results_view(st.session_state.current_results)
 
 # Rodapé
 st.markdown("---")
@@ -1,10 +1,99 @@
 import streamlit as st
 import pandas as pd
+import os
+import re
 import time
 import io
-from batch_processor_llm import BatchAbsolutionAnalyzerLLM
+import math
+from dotenv import load_dotenv
+from batch_processor import BigDataCache
+from batch_processor_llm import (
+    BatchAbsolutionAnalyzerLLM, LLMVerdictCache, BatchJobStore, results_to_frame,
+    DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE, DEFAULT_LLM_TIMEOUT
+)
 from datetime import datetime
 
+# Pontuação aceita na formatação de CPFs (000.000.000-00)
+CPF_PUNCTUATION_RE = re.compile(r'[.\-]')
+
+# Linhas por bloco na leitura do CSV enviado
+CSV_CHUNK_SIZE = 50_000
+
+# Linhas por página na tabela de resultados
+TABLE_PAGE_SIZE = 50
+
+# Funções com cache (recalculadas apenas quando os resultados mudam)
+@st.cache_data(show_spinner=False)
+def _parse_upload(data, file_type):
+    """Extrair os CPFs válidos do arquivo enviado como Series (cache pelo conteúdo do arquivo)"""
+    if file_type == "text/csv":
+        # Processar CSV: ler só o cabeçalho para escolher a coluna
+        header = pd.read_csv(io.BytesIO(data), nrows=0, encoding='utf-8-sig').columns
+        # Se não tem cabeçalho CPF, usar primeira coluna
+        cpf_column = 'CPF' if 'CPF' in header else header[0]
+        
+        # Em blocos e só com a coluna do CPF, como texto (preserva zeros à esquerda)
+        chunks = pd.read_csv(
+            io.BytesIO(data),
+            usecols=[cpf_column],
+            dtype=str,
+            keep_default_na=False,
+            chunksize=CSV_CHUNK_SIZE,
+            encoding='utf-8-sig'
+        )
+        cpf_series = pd.concat((chunk[cpf_column] for chunk in chunks), ignore_index=True)
+    else:
+        # Processar TXT linha a linha, sem decodificar o arquivo inteiro de uma vez
+        text_stream = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig')
+        cpf_series = pd.Series([line.strip() for line in text_stream if line.strip()], dtype=str)
+    
+    # Limpar CPFs inválidos (vetorizado: um único passe em C sobre a coluna)
+    mask = cpf_series.str.replace(CPF_PUNCTUATION_RE, '', regex=True).str.len() >= 11
+    return cpf_series[mask].reset_index(drop=True)
+
+@st.cache_data(show_spinner=False)
+def _build_table(results_df):
+    """Tabela de exibição dos resultados da IA"""
+    absolvido = results_df['foi_absolvido']
+    confianca = results_df['confianca_analise']
+    
+    status_icon = pd.Series('❓ Sem dados', index=results_df.index)
+    status_icon[absolvido.eq(True).fillna(False)] = '✅ Sim'
+    status_icon[absolvido.eq(False).fillna(False)] = '❌ Não'
+    
+    table_df = pd.DataFrame({
+        'CPF': results_df['cpf'],
+        'Nome': results_df['nome'],
+        'Foi Absolvido': status_icon,
+        'Confiança IA': confianca.fillna(0),  # UInt8; "%" aplicado só na renderização
+        'Processos Criminais': results_df['total_processos_criminais'],
+        'Status': results_df['status']
+    })
+    
+    # Coluna auxiliar (não exibida) para filtrar com máscaras vetorizadas
+    table_df['_absolvido'] = absolvido
+    return table_df
+
+@st.cache_data(show_spinner=False)
+def _csv_bytes(results_df, high_confidence_only=False):
+    """CSV de download (UTF-8 com BOM): todos os resultados ou apenas absolvidos com alta confiança"""
+    if high_confidence_only:
+        results_df = results_df[
+            results_df['foi_absolvido'].eq(True).fillna(False) & results_df['confianca_analise'].ge(80).fillna(False)
+        ]
+    
+    csv_df = results_df.rename(columns={
+        'cpf': 'CPF',
+        'nome': 'Nome',
+        'foi_absolvido': 'Foi_Absolvido',
+        'confianca_analise': 'Confianca_IA',
+        'justificativa': 'Justificativa_IA',
+        'detalhes_ia': 'Detalhes_IA',
+        'total_processos_criminais': 'Total_Processos_Criminais',
+        'status': 'Status'
+    })
+    return csv_df.to_csv(index=False).encode('utf-8-sig')
+
 # Configuração da página
 st.set_page_config(
     page_title="Análise Inteligente de Absolvição - LLM", 
@@ -45,6 +134,61 @@ CPF
 - **Confiança** na conclusão (0-100%)
 """)
 
+# Cache de veredictos da IA (SQLite), compartilhado entre sessões e reruns
+@st.cache_resource
+def get_verdict_cache():
+    return LLMVerdictCache()
+
+verdict_cache = get_verdict_cache()
+
+# Cache das respostas da BigData (SQLite), compartilhado entre sessões e reruns
+@st.cache_resource
+def get_response_cache():
+    return BigDataCache()
+
+response_cache = get_response_cache()
+
+# Jobs da OpenAI Batch API em disco: retomáveis pelo ID mesmo depois de fechar a aba
+@st.cache_resource
+def get_batch_job_store():
+    return BatchJobStore()
+
+batch_job_store = get_batch_job_store()
+
+# Analisador reaproveitado entre reruns/sessões para a mesma configuração (cliente OpenAI incluso)
+@st.cache_resource
+def get_analyzer(max_workers=5, delay=0.3, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, batch_size=1,
+                 request_timeout=DEFAULT_LLM_TIMEOUT, _verdict_cache=None, _response_cache=None):
+    return BatchAbsolutionAnalyzerLLM(
+        max_workers=max_workers,
+        delay_between_requests=delay,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        batch_size=batch_size,
+        verdict_cache=_verdict_cache,
+        request_timeout=request_timeout,
+        response_cache=_response_cache
+    )
+
+# Timeout de cada chamada à OpenAI (modelos lentos podem precisar de mais)
+llm_timeout = st.sidebar.number_input(
+    "Timeout (s)",
+    min_value=5,
+    max_value=300,
+    value=int(DEFAULT_LLM_TIMEOUT),
+    step=5,
+    help="Tempo máximo de espera por resposta da OpenAI antes de tentar novamente"
+)
+
+if st.sidebar.button("🗑️ Limpar cache", help="Apaga os veredictos da IA guardados; os próximos lotes voltam a consultar a OpenAI"):
+    verdict_cache.clear()
+    st.sidebar.success("Cache de veredictos da IA limpo")
+
+if st.sidebar.button("🗑️ Limpar cache da BigData", help="Apaga as respostas da BigData guardadas; os próximos lotes voltam a consultar a API"):
+    response_cache.clear()
+    st.sidebar.success("Cache de respostas da BigData limpo")
+
 # Aviso sobre OpenAI
 st.info("🤖 **Esta versão usa Inteligência Artificial (GPT-4)** para análise contextual. É mais precisa, mas mais lenta e consome tokens OpenAI.")
 
@@ -57,82 +201,111 @@ uploaded_file = st.file_uploader(
     help="Arquivo deve conter CPFs (CSV com cabeçalho 'CPF' ou TXT com um CPF por linha)"
 )
 
-cpfs_to_analyze = []
+# CPFs mantidos como Series: vira lista só ao iniciar a análise
+cpfs_to_analyze = pd.Series(dtype=str)
 
 if uploaded_file is not None:
     try:
-        if uploaded_file.type == "text/csv":
-            # Processar CSV
-            df = pd.read_csv(uploaded_file)
-            if 'CPF' in df.columns:
-                cpfs_to_analyze = df['CPF'].astype(str).tolist()
-            else:
-                # Se não tem cabeçalho CPF, usar primeira coluna
-                cpfs_to_analyze = df.iloc[:, 0].astype(str).tolist()
-        else:
-            # Processar TXT
-            content = uploaded_file.read().decode('utf-8-sig')
-            cpfs_to_analyze = [line.strip() for line in content.split('\n') if line.strip()]
-        
-        # Limpar CPFs inválidos
-        cpfs_to_analyze = [cpf for cpf in cpfs_to_analyze if len(cpf.replace('.', '').replace('-', '')) >= 11]
+        cpfs_to_analyze = _parse_upload(uploaded_file.getvalue(), uploaded_file.type)
         
         st.success(f"✅ {len(cpfs_to_analyze)} CPFs carregados com sucesso!")
         
         # Mostrar preview
         if len(cpfs_to_analyze) > 0:
             st.subheader("👀 Preview dos CPFs")
-            preview_df = pd.DataFrame({
-                'CPF': cpfs_to_analyze[:10]  # Mostrar apenas os primeiros 10
-            })
-            st.dataframe(preview_df, width='stretch')
+            # Mostrar apenas os primeiros 10
+            st.dataframe(cpfs_to_analyze.head(10).to_frame('CPF'), width='stretch')
             
             if len(cpfs_to_analyze) > 10:
                 st.info(f"Mostrando apenas os primeiros 10 CPFs. Total: {len(cpfs_to_analyze)}")
         
     except Exception as e:
         st.error(f"Erro ao processar arquivo: {str(e)}")
-        cpfs_to_analyze = []
+        cpfs_to_analyze = pd.Series(dtype=str)
 
 # Configurações da análise IA
-if cpfs_to_analyze:
+if not cpfs_to_analyze.empty:
     st.header("🧠 Configurações da Análise IA")
     
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     
     with col1:
         max_workers = st.slider(
-            "Threads paralelas (IA)", 
+            "Threads paralelas (BigData)", 
             min_value=1, 
             max_value=8, 
             value=3,
-            help="Menos threads para IA evita sobrecarga. Recomendado: 2-5"
+            help="Consultas simultâneas à BigData. As chamadas à IA são reguladas pelos limites RPM/TPM"
         )
     
     with col2:
-        delay = st.slider(
-            "Delay entre requisições (segundos)", 
-            min_value=0.2, 
-            max_value=3.0, 
-            value=0.5, 
-            step=0.1,
-            help="IA precisa de mais delay para processar contexto"
+        rows_per_request = st.slider(
+            "CPFs por chamada LLM",
+            min_value=1,
+            max_value=20,
+            value=5,
+            help="Agrupa vários CPFs num único prompt: menos requisições à OpenAI (limite RPM) e prompt de sistema pago uma vez por grupo"
+        )
+    
+    with col3:
+        batch_mode = st.toggle(
+            "Modo Batch (24h, 50% mais barato)",
+            value=False,
+            help="Envia as análises para a OpenAI Batch API: resultado em até 24h, custo 50% menor e limite de 10.000 CPFs"
         )
     
+    with st.expander("⚙️ Avançado"):
+        adv_col1, adv_col2, adv_col3 = st.columns(3)
+        
+        with adv_col1:
+            delay = st.slider(
+                "Delay entre requisições BigData (segundos)", 
+                min_value=0.2, 
+                max_value=3.0, 
+                value=0.5, 
+                step=0.1,
+                help="Define o ritmo das consultas à BigData (threads por delay), espaçadas igualmente para evitar rate limiting"
+            )
+        
+        with adv_col2:
+            requests_per_minute = st.number_input(
+                "Limite OpenAI (requisições/min)",
+                min_value=1,
+                value=DEFAULT_REQUESTS_PER_MINUTE,
+                step=50,
+                help="RPM da sua conta OpenAI para o modelo usado"
+            )
+        
+        with adv_col3:
+            tokens_per_minute = st.number_input(
+                "Limite OpenAI (tokens/min)",
+                min_value=1000,
+                value=DEFAULT_TOKENS_PER_MINUTE,
+                step=10_000,
+                help="TPM da sua conta OpenAI para o modelo usado"
+            )
+    
     # Estimativa de tempo (mais conservadora para IA)
-    estimated_time = (len(cpfs_to_analyze) / max_workers) * (delay + 2.0)  # +2s para processamento IA
-    st.warning(f"⏱️ Tempo estimado: {estimated_time:.1f} segundos ({estimated_time/60:.1f} minutos)")
+    if batch_mode:
+        st.warning("⏱️ Modo Batch: a OpenAI conclui o lote em até 24 horas (normalmente bem antes)")
+    else:
+        estimated_time = (len(cpfs_to_analyze) / max_workers) * (delay + 2.0)  # +2s para processamento IA
+        st.warning(f"⏱️ Tempo estimado: {estimated_time:.1f} segundos ({estimated_time/60:.1f} minutos)")
     st.info("🧠 A análise IA é mais lenta mas muito mais precisa que regex simples!")
     
     # Aviso sobre custos
     cost_estimate = len(cpfs_to_analyze) * 0.01  # Estimativa rough de $0.01 por CPF
+    if batch_mode:
+        cost_estimate *= 0.5  # Batch API custa metade
     st.warning(f"💰 Custo estimado OpenAI: ~${cost_estimate:.2f} USD (aproximadamente)")
 
-# Verificar se OpenAI está configurado
-import os
-from dotenv import load_dotenv
-load_dotenv()
-openai_key = os.getenv('OPENAI_API_KEY')
+# Verificar se OpenAI está configurado (.env lido uma única vez, não a cada rerun)
+@st.cache_resource
+def _openai_key():
+    load_dotenv()
+    return os.getenv('OPENAI_API_KEY')
+
+openai_key = _openai_key()
 
 if not openai_key:
     st.error("❌ **OPENAI_API_KEY não configurada!**")
@@ -141,19 +314,69 @@ if not openai_key:
 else:
     st.success("✅ OpenAI API Key configurada")
 
+# Verificar lote da Batch API: uma consulta de status por clique, sem bloquear a página até o fim do lote
+def _check_offline_batch(analyzer, job):
+    st.subheader("📦 Lote Batch API")
+    st.caption(f"ID do lote OpenAI: {job['batch_id']}")
+    
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    def update_batch_progress(completed, total, status):
+        progress_bar.progress(completed / total if total else 1.0)
+        status_text.text(f"📦 Status do lote: {status} - {completed}/{total} análises IA concluídas")
+    
+    results = analyzer.check_batch_offline(job, progress_callback=update_batch_progress)
+    if results is None:
+        st.info("⏳ O lote ainda está em processamento na OpenAI. Pode fechar a aba e verificar novamente mais tarde.")
+        return
+    
+    st.session_state.results_df_llm = results_to_frame(results)
+    batch_job_store.delete(job['batch_id'])
+    progress_bar.progress(1.0)
+    status_text.text("🧠✅ Lote Batch API concluído!")
+
 # Botão para iniciar análise IA
-if cpfs_to_analyze and st.button("🧠 Iniciar Análise IA", type="primary"):
+if not cpfs_to_analyze.empty and st.button("🧠 Iniciar Análise IA", type="primary"):
     
-    # Verificar limite
-    if len(cpfs_to_analyze) > 1000:  # Limite menor para IA
-        st.error("❌ Limite máximo de 1.000 CPFs para análise IA. Por favor, reduza a lista.")
-        st.info("💡 Para lotes maiores, use a versão rápida (sem IA)")
+    # Verificar limite (maior no modo Batch)
+    max_cpfs = 10000 if batch_mode else 1000
+    if len(cpfs_to_analyze) > max_cpfs:
+        limite = f"{max_cpfs:,}".replace(",", ".")
+        st.error(f"❌ Limite máximo de {limite} CPFs para análise IA neste modo. Por favor, reduza a lista.")
+        st.info("💡 Para lotes maiores, use o Modo Batch ou a versão rápida (sem IA)")
+    elif batch_mode:
+        try:
+            analyzer = get_analyzer(
+                max_workers=max_workers,
+                delay=delay,
+                request_timeout=llm_timeout,
+                _verdict_cache=verdict_cache, _response_cache=response_cache
+            )
+            
+            with st.spinner("📤 Consultando BigData e enviando lote para a OpenAI..."):
+                job = analyzer.submit_batch_offline(cpfs_to_analyze.tolist())
+            
+            if job['batch_id']:
+                batch_job_store.save(job)
+                st.success(f"📤 Lote enviado para a OpenAI (ID: {job['batch_id']}). Pode fechar a aba e verificar o andamento abaixo quando quiser.")
+            else:
+                # Todos os CPFs resolvidos sem IA (sem dados, sem decisões ou com veredicto em cache)
+                st.session_state.results_df_llm = results_to_frame(analyzer.check_batch_offline(job))
+            
+        except Exception as e:
+            st.error(f"❌ Erro durante a análise IA (Batch): {str(e)}")
     else:
         # Inicializar analisador IA
         try:
-            analyzer = BatchAbsolutionAnalyzerLLM(
+            analyzer = get_analyzer(
                 max_workers=max_workers,
-                delay_between_requests=delay
+                delay=delay,
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                batch_size=rows_per_request,
+                request_timeout=llm_timeout,
+                _verdict_cache=verdict_cache, _response_cache=response_cache
             )
             
             # Containers para mostrar progresso
@@ -177,36 +400,46 @@ if cpfs_to_analyze and st.button("🧠 Iniciar Análise IA", type="primary"):
                 with stats_cols[3]:
                     confidence_metric = st.metric("Confiança Média", "0%")
             
+            # Contadores acumulados do lote (atualizados só com o delta de cada resultado)
+            running = {'absolvidos': 0, 'conf_sum': 0.0, 'conf_n': 0}
+            seen_cpfs = set()
+            
+            # Limitar a frequência de atualização da interface (no máximo 5 vezes por segundo)
+            last_update = [0.0]
+            
             # Função de callback para atualizar progresso
             def update_progress(processed, total, result):
+                # Contar absolvidos e somar confiança, O(1) por resultado
+                if result['cpf'] not in seen_cpfs:  # Evitar duplicatas
+                    seen_cpfs.add(result['cpf'])
+                    if result.get('foi_absolvido') is True:
+                        running['absolvidos'] += 1
+                    confianca = result.get('confianca_analise')
+                    if confianca:
+                        running['conf_sum'] += confianca
+                        running['conf_n'] += 1
+                
+                now = time.perf_counter()
+                if processed != total and now - last_update[0] < 0.2:
+                    return
+                last_update[0] = now
+                
                 progress = processed / total
                 progress_bar.progress(progress)
                 status_text.text(f"🤖 Analisando com IA: {processed}/{total} - {result['cpf']}")
                 
-                # Contar absolvidos e calcular confiança média
-                current_results = st.session_state.get('current_results_llm', [])
-                if result not in current_results:  # Evitar duplicatas
-                    current_results.append(result)
-                    st.session_state.current_results_llm = current_results
-                
-                absolvidos_count = sum(1 for r in current_results if r.get('foi_absolvido') is True)
-                confidences = [r.get('confianca_analise', 0) for r in current_results if r.get('confianca_analise')]
-                avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+                avg_confidence = running['conf_sum'] / running['conf_n'] if running['conf_n'] else 0
                 
                 # Atualizar métricas
                 processed_metric.metric("Processados", processed)
-                absolved_metric.metric("Absolvidos (IA)", absolvidos_count)
+                absolved_metric.metric("Absolvidos (IA)", running['absolvidos'])
                 confidence_metric.metric("Confiança Média", f"{avg_confidence:.1f}%")
             
-            # Inicializar session state para resultados IA
-            if 'current_results_llm' not in st.session_state:
-                st.session_state.current_results_llm = []
-            
             # Executar análise IA
             start_time = time.time()
             
-            results = analyzer.process_batch(cpfs_to_analyze, progress_callback=update_progress)
-            st.session_state.current_results_llm = results
+            results = analyzer.process_batch(cpfs_to_analyze.tolist(), progress_callback=update_progress)
+            st.session_state.results_df_llm = results_to_frame(results)
             
             end_time = time.time()
             elapsed_time = end_time - start_time
@@ -217,18 +450,34 @@ if cpfs_to_analyze and st.button("🧠 Iniciar Análise IA", type="primary"):
             
         except Exception as e:
             st.error(f"❌ Erro durante a análise IA: {str(e)}")
-            st.session_state.current_results_llm = []
+            st.session_state.results_df_llm = None
 
-# Mostrar resultados IA se existirem
-if 'current_results_llm' in st.session_state and st.session_state.current_results_llm:
-    results = st.session_state.current_results_llm
-    
+# Retomar lotes da Batch API (guardados em disco, sobrevivem ao fechamento da aba)
+pending_batch_ids = batch_job_store.pending_ids()
+with st.expander("📦 Lotes Batch API enviados", expanded=bool(pending_batch_ids)):
+    batch_id = st.text_input(
+        "ID do lote OpenAI",
+        value=pending_batch_ids[0] if pending_batch_ids else "",
+        help="Lotes aguardando coleta: " + (", ".join(pending_batch_ids) or "nenhum")
+    ).strip()
+    if st.button("🔄 Verificar lote", disabled=not batch_id):
+        job = batch_job_store.load(batch_id)
+        if job is None:
+            st.error("❌ Lote não encontrado entre os enviados (ou já coletado)")
+        else:
+            try:
+                _check_offline_batch(get_analyzer(request_timeout=llm_timeout, _verdict_cache=verdict_cache, _response_cache=response_cache), job)
+            except Exception as e:
+                st.error(f"❌ Erro ao verificar o lote: {str(e)}")
+
+# Mostrar resultados IA (fragmento: interações com filtros reexecutam apenas esta seção)
+@st.fragment
+def _results_view(results_frame):
     with st.container():
         st.header("🧠 Resultados da Análise IA")
         
         # Calcular estatísticas IA
-        analyzer = BatchAbsolutionAnalyzerLLM()
-        stats = analyzer.get_summary_stats(results)
+        stats = BatchAbsolutionAnalyzerLLM.get_summary_stats(results_frame)
         
         # Mostrar estatísticas IA
         st.subheader("📊 Estatísticas da Inteligência Artificial")
@@ -290,30 +539,8 @@ if 'current_results_llm' in st.session_state and st.session_state.current_result
         # Tabela de resultados IA
         st.subheader("📋 Resultados Detalhados da IA")
         
-        # Preparar dados para tabela
-        table_data = []
-        for result in results:
-            foi_absolvido = result['foi_absolvido']
-            if foi_absolvido is True:
-                status_icon = '✅ Sim'
-                status_color = 'normal'
-            elif foi_absolvido is False:
-                status_icon = '❌ Não'
-                status_color = 'inverse'
-            else:
-                status_icon = '❓ Sem dados'
-                status_color = 'off'
-                
-            table_data.append({
-                'CPF': result['cpf'],
-                'Nome': result['nome'],
-                'Foi Absolvido': status_icon,
-                'Confiança IA': f"{result.get('confianca_analise', 0)}%",
-                'Processos Criminais': result['total_processos_criminais'],
-                'Status': result['status']
-            })
-        
-        results_df = pd.DataFrame(table_data)
+        # Preparar dados para tabela (cache: reruns de filtro não reconstroem a tabela)
+        results_df = _build_table(results_frame)
         
         # Filtros
         col1, col2, col3 = st.columns(3)
@@ -333,129 +560,107 @@ if 'current_results_llm' in st.session_state and st.session_state.current_result
         with col3:
             name_filter = st.text_input("Filtrar por nome:", placeholder="Digite parte do nome...")
         
-        # Aplicar filtros
-        filtered_df = results_df.copy()
-        filtered_results = results.copy()
+        # Aplicar filtros (uma única máscara sobre a tabela)
+        mask = pd.Series(True, index=results_df.index)
+        absolvido = results_df['_absolvido']
+        confianca = results_df['Confiança IA']
         
         if status_filter == 'Apenas Absolvidos':
-            filtered_df = filtered_df[filtered_df['Foi Absolvido'] == '✅ Sim']
-            filtered_results = [r for r in results if r['foi_absolvido'] is True]
+            mask &= absolvido.eq(True).fillna(False)
         elif status_filter == 'Apenas Não Absolvidos':
-            filtered_df = filtered_df[filtered_df['Foi Absolvido'] == '❌ Não']
-            filtered_results = [r for r in results if r['foi_absolvido'] is False]
+            mask &= absolvido.eq(False).fillna(False)
         elif status_filter == 'Apenas Sem Dados':
-            filtered_df = filtered_df[filtered_df['Foi Absolvido'] == '❓ Sem dados']
-            filtered_results = [r for r in results if r['foi_absolvido'] is None]
+            mask &= absolvido.isna()
         
         if confidence_filter == 'Alta Confiança (≥80%)':
-            filtered_results = [r for r in filtered_results if r.get('confianca_analise', 0) >= 80]
+            mask &= confianca >= 80
         elif confidence_filter == 'Média Confiança (50-79%)':
-            filtered_results = [r for r in filtered_results if 50 <= r.get('confianca_analise', 0) < 80]
+            mask &= (confianca >= 50) & (confianca < 80)
         elif confidence_filter == 'Baixa Confiança (<50%)':
-            filtered_results = [r for r in filtered_results if r.get('confianca_analise', 0) < 50]
+            mask &= confianca < 50
         
         if name_filter:
-            filtered_results = [r for r in filtered_results if name_filter.lower() in r['nome'].lower()]
-        
-        # Reconstruir DataFrame filtrado
-        if confidence_filter != 'Todas' or name_filter:
-            filtered_table_data = []
-            for result in filtered_results:
-                foi_absolvido = result['foi_absolvido']
-                if foi_absolvido is True:
-                    status_icon = '✅ Sim'
-                elif foi_absolvido is False:
-                    status_icon = '❌ Não'
-                else:
-                    status_icon = '❓ Sem dados'
-                    
-                filtered_table_data.append({
-                    'CPF': result['cpf'],
-                    'Nome': result['nome'],
-                    'Foi Absolvido': status_icon,
-                    'Confiança IA': f"{result.get('confianca_analise', 0)}%",
-                    'Processos Criminais': result['total_processos_criminais'],
-                    'Status': result['status']
-                })
-            filtered_df = pd.DataFrame(filtered_table_data)
-        
-        st.dataframe(filtered_df, width='stretch', hide_index=True)
+            mask &= results_df['Nome'].str.contains(name_filter, case=False, regex=False, na=False)
+        
+        # Posições das linhas filtradas: só as linhas exibidas são copiadas das tabelas
+        filtered_rows = mask.to_numpy(dtype=bool).nonzero()[0]
+        total_filtered = len(filtered_rows)
+        
+        # Paginar: só a página atual é enviada ao navegador
+        total_pages = max(1, math.ceil(total_filtered / TABLE_PAGE_SIZE))
+        page = st.number_input("Página", min_value=1, max_value=total_pages, value=1, step=1)
+        start = (page - 1) * TABLE_PAGE_SIZE
+        if total_pages > 1:
+            st.caption(f"Página {page} de {total_pages} - {total_filtered} resultados filtrados")
+        
+        st.dataframe(
+            results_df.iloc[filtered_rows[start:start + TABLE_PAGE_SIZE]].drop(columns='_absolvido'),
+            width='stretch',
+            hide_index=True,
+            column_config={
+                'Confiança IA': st.column_config.ProgressColumn(
+                    'Confiança IA', min_value=0, max_value=100, format='%d%%'
+                )
+            }
+        )
         
         # Análises detalhadas da IA
         if st.checkbox("🧠 Mostrar Justificativas da IA"):
             st.subheader("🤖 Análises Detalhadas da Inteligência Artificial")
             
-            for result in filtered_results[:20]:  # Limitar a 20 para performance
-                confianca = result.get('confianca_analise', 0)
+            for result in results_frame.iloc[filtered_rows[:20]].to_dict('records'):  # Limitar a 20 para performance
+                confianca = 0 if pd.isna(result['confianca_analise']) else result['confianca_analise']
                 cor_confianca = "🟢" if confianca >= 80 else "🟡" if confianca >= 50 else "🔴"
                 
                 with st.expander(f"{cor_confianca} {result['nome']} ({result['cpf']}) - Confiança: {confianca}%"):
                     col1, col2 = st.columns(2)
                     
                     with col1:
-                        st.markdown(f"**🎯 Resultado:** {result['foi_absolvido']}")
+                        foi_absolvido = None if pd.isna(result['foi_absolvido']) else result['foi_absolvido']
+                        st.markdown(f"**🎯 Resultado:** {foi_absolvido}")
                         st.markdown(f"**📊 Confiança:** {confianca}%")
                         st.markdown(f"**⚖️ Processos:** {result['total_processos_criminais']}")
                     
                     with col2:
                         st.markdown("**🧠 Justificativa da IA:**")
-                        st.write(result.get('justificativa', 'Sem justificativa'))
+                        st.write(result['justificativa'] or 'Sem justificativa')
                     
                     st.markdown("**🔍 Detalhes da Análise:**")
-                    st.info(result.get('detalhes_ia', 'Sem detalhes'))
+                    st.info(result['detalhes_ia'] or 'Sem detalhes')
             
-            if len(filtered_results) > 20:
-                st.info(f"Mostrando apenas os primeiros 20 resultados. Total filtrado: {len(filtered_results)}")
+            if total_filtered > 20:
+                st.info(f"Mostrando apenas os primeiros 20 resultados. Total filtrado: {total_filtered}")
         
         # Download dos resultados IA
         st.subheader("💾 Download dos Resultados IA")
         
-        # Preparar CSV para download com dados da IA
-        csv_data = []
-        for result in results:
-            csv_data.append({
-                'CPF': result['cpf'],
-                'Nome': result['nome'],
-                'Foi_Absolvido': result['foi_absolvido'],
-                'Confianca_IA': result.get('confianca_analise', 0),
-                'Justificativa_IA': result.get('justificativa', ''),
-                'Detalhes_IA': result.get('detalhes_ia', ''),
-                'Total_Processos_Criminais': result['total_processos_criminais'],
-                'Status': result['status']
-            })
-        
-        csv_df = pd.DataFrame(csv_data)
-        csv_buffer = io.StringIO()
-        csv_df.to_csv(csv_buffer, index=False, encoding='utf-8-sig')
-        csv_string = csv_buffer.getvalue()
-        
         col1, col2 = st.columns(2)
         
         with col1:
             st.download_button(
                 label="🧠 Baixar Resultados IA Completos (CSV)",
-                data=csv_string,
+                data=_csv_bytes(results_frame),  # Com cache: serializado uma vez por lote de resultados
                 file_name=f"analise_absolvicoes_ia_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                 mime="text/csv",
                 help="Download com análises completas da IA"
             )
         
         with col2:
-            # CSV apenas dos absolvidos com alta confiança
-            high_conf_absolved = csv_df[(csv_df['Foi_Absolvido'] == True) & (csv_df['Confianca_IA'] >= 80)]
-            if len(high_conf_absolved) > 0:
-                csv_buffer_hc = io.StringIO()
-                high_conf_absolved.to_csv(csv_buffer_hc, index=False, encoding='utf-8-sig')
-                csv_string_hc = csv_buffer_hc.getvalue()
-                
+            # CSV apenas dos absolvidos com alta confiança (serializado só se houver algum)
+            if (results_frame['foi_absolvido'].eq(True) & results_frame['confianca_analise'].ge(80)).any():
                 st.download_button(
                     label="⭐ Baixar Alta Confiança (CSV)",
-                    data=csv_string_hc,
+                    data=_csv_bytes(results_frame, high_confidence_only=True),
                     file_name=f"absolvidos_alta_confianca_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                     mime="text/csv",
                     help="Download apenas dos absolvidos com confiança ≥ 80%"
                 )
 
+# Mostrar resultados IA se existirem
+results_frame = st.session_state.get('results_df_llm')
+if results_frame is not None and len(results_frame) > 0:
+    _results_view(results_frame)
+
 # Rodapé
 st.markdown("---")
 st.markdown(f"""
@@ -1,15 +1,23 @@
 # 📦 #### Batch Processor com LLM - Análise Inteligente de Absolvição em Lote
 import os
 import re
-import json
+import orjson
 import time
+import codecs
+import sqlite3
+import hashlib
+import asyncio
 import threading
 from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import openai
 from dotenv import load_dotenv
+from batch_processor import (
+    BigDataCache, BigDataRateLimiter, bigdata_session, bigdata_async_session, bigdata_payload_template,
+    BIGDATA_URL, BIGDATA_TIMEOUT, sanitize_cpf
+)
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -19,12 +27,324 @@ bigdata_token_id = os.getenv('BIGDATA_TOKEN_ID')
 bigdata_token_hash = os.getenv('BIGDATA_TOKEN_HASH')
 openai_api_key = os.getenv('OPENAI_API_KEY')
 
+# 🌐 #### Consulta BigData (processos criminais como réu + sanções do CNJ)
+BIGDATA_DATASETS = """basic_data,
+                               processes.filter(partypolarity = PASSIVE, courttype = CRIMINAL),
+                               kyc.filter(standardized_type, standardized_sanction_type, type, sanctions_source = Conselho Nacional de Justiça)"""
+
+# Papéis de parte que identificam o réu
+_DEFENDANT_TAGS = frozenset({"DEFENDANT", "RÉU"})
+
+# 🤖 #### Parâmetros da LLM
+LLM_MODEL = "gpt-4o-mini"
+LLM_SYSTEM_PROMPT = "Você é um analista jurídico especializado em análise de absolvições. Responda sempre em JSON válido."
+LLM_PROMPT_VERSION = "1"  # Incrementar ao mudar os prompts: invalida o cache de veredictos
+
+# Cache local (SQLite) dos veredictos da IA
+LLM_CACHE_PATH = "llm_cache.db"
+
+# Status finais de um lote da OpenAI Batch API
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Limites padrão da conta OpenAI para o modelo (requisições e tokens por minuto)
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200_000
+LLM_MAX_ATTEMPTS = 3
+
+# Chamadas (grupos de CPFs) à IA em andamento ao mesmo tempo, independente das consultas BigData
+DEFAULT_LLM_CONCURRENCY = 8
+
+# Limites por chamada à OpenAI: timeout (segundos), tentativas do cliente e tokens de saída por CPF
+DEFAULT_LLM_TIMEOUT = 20.0
+LLM_CONNECT_TIMEOUT = 5.0
+LLM_MAX_RETRIES = 3
+LLM_MAX_OUTPUT_TOKENS = 500
+
+class _RateLimiter:
+    """Token bucket de requisições (RPM) e tokens (TPM) compartilhado pelas tarefas assíncronas
+    
+    A capacidade é reposta continuamente; uma chamada só é liberada quando há orçamento
+    para ela, em vez de esperar um delay fixo entre requisições.
+    """
+    
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_request_capacity = requests_per_minute
+        self.available_token_capacity = tokens_per_minute
+        self.last_update = time.monotonic()
+        self.paused_until = 0.0
+    
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.available_request_capacity = min(
+            self.requests_per_minute,
+            self.available_request_capacity + elapsed * self.requests_per_minute / 60
+        )
+        self.available_token_capacity = min(
+            self.tokens_per_minute,
+            self.available_token_capacity + elapsed * self.tokens_per_minute / 60
+        )
+        self.last_update = now
+    
+    async def acquire(self, tokens: int):
+        """Aguardar até haver capacidade para uma requisição de `tokens` tokens"""
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            
+            self._refill()
+            if self.available_request_capacity >= 1 and self.available_token_capacity >= tokens:
+                self.available_request_capacity -= 1
+                self.available_token_capacity -= tokens
+                return
+            
+            # Dormir exatamente o tempo necessário para repor o que falta
+            wait = max(
+                (1 - self.available_request_capacity) * 60 / self.requests_per_minute,
+                (tokens - self.available_token_capacity) * 60 / self.tokens_per_minute
+            )
+            await asyncio.sleep(max(wait, 0.001))
+    
+    def pause(self, seconds: float):
+        """Suspender todas as tarefas (ex.: após um 429, até o reset informado pela API)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+def _parse_rate_limit_reset(value: Optional[str]) -> Optional[float]:
+    """Converter cabeçalhos x-ratelimit-reset-* ("1s", "6m0s", "20ms") em segundos"""
+    if not value:
+        return None
+    partes = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    if not partes:
+        return None
+    unidades = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(numero) * unidades[unidade] for numero, unidade in partes)
+
+# Colunas da tabela de resultados (um array por campo em vez de uma lista de dicts)
+RESULT_COLUMNS = ["cpf", "nome", "foi_absolvido", "confianca_analise", "justificativa",
+                  "detalhes_ia", "total_processos_criminais", "status"]
+
+def results_to_frame(results: List[Dict]) -> pd.DataFrame:
+    """Converter os resultados (lista de dicts) em DataFrame com tipos compactos"""
+    df = pd.DataFrame.from_records(results, columns=RESULT_COLUMNS)
+    # Veredicto tri-estado: True / False / <NA> (qualquer outro valor vira "sem dados")
+    df["foi_absolvido"] = pd.array(
+        [v if isinstance(v, bool) else None for v in df["foi_absolvido"]], dtype="boolean"
+    )
+    df["confianca_analise"] = (
+        pd.to_numeric(df["confianca_analise"], errors="coerce").clip(0, 100).round().astype("UInt8")
+    )
+    df["total_processos_criminais"] = df["total_processos_criminais"].fillna(0).astype("int32")
+    return df
+
+# Schema explícito do CSV da IA (colunas de texto nunca inferidas a partir de listas/objetos)
+LLM_CSV_SCHEMA = pa.schema([
+    ("CPF", pa.string()),
+    ("Nome", pa.string()),
+    ("Foi_Absolvido", pa.bool_()),
+    ("Confianca_Analise", pa.uint8()),
+    ("Justificativa_IA", pa.string()),
+    ("Detalhes_IA", pa.string()),
+    ("Total_Processos_Criminais", pa.int32()),
+    ("Status", pa.string())
+])
+LLM_CSV_TEXT_COLUMNS = ["CPF", "Nome", "Justificativa_IA", "Detalhes_IA", "Status"]
+
+def _as_text(valor):
+    """Lista/objeto vindo da IA (no lugar de uma string) vira o texto JSON; o resto passa direto"""
+    if isinstance(valor, (list, dict)):
+        return orjson.dumps(valor).decode()
+    return valor
+
+class LLMVerdictCache:
+    """Cache em SQLite dos veredictos da IA por `blake2b(modelo|versão do prompt|nome|decisões)`
+    
+    Um CPF que reaparece num lote posterior com as mesmas decisões é servido do disco, sem nova
+    chamada paga à OpenAI. A chave é o conteúdo do prompt e não o CPF: decisões novas na BigData
+    mudam a chave e levam a uma nova análise, em vez de reaproveitar um veredicto desatualizado.
+    """
+    
+    def __init__(self, path: str = LLM_CACHE_PATH):
+        # Uma conexão compartilhada entre as sessões/threads do Streamlit, serializada pelo lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_verdicts (
+                    hash TEXT PRIMARY KEY,
+                    foi_absolvido INTEGER,
+                    confianca INTEGER,
+                    justificativa TEXT,
+                    detalhes TEXT
+                )
+            """)
+    
+    @staticmethod
+    def key(texto_decisoes: str, nome: str) -> str:
+        # Normalizado (caixa do nome, espaços nas bordas) para casar prompts equivalentes
+        conteudo = f"{LLM_MODEL}|{LLM_PROMPT_VERSION}|{nome.strip().upper()}|{texto_decisoes.strip()}"
+        return hashlib.blake2b(conteudo.encode(), digest_size=16).hexdigest()
+    
+    def get_key(self, key: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT foi_absolvido, confianca, justificativa, detalhes FROM llm_verdicts WHERE hash = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        
+        foi_absolvido, confianca, justificativa, detalhes = row
+        return {
+            "foi_absolvido": None if foi_absolvido is None else bool(foi_absolvido),
+            "confianca_analise": confianca,
+            "justificativa": justificativa,
+            "detalhes_ia": detalhes
+        }
+    
+    def set_key(self, key: str, resultado_ia: Dict):
+        foi_absolvido = resultado_ia.get("foi_absolvido")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_verdicts VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    None if foi_absolvido is None else int(bool(foi_absolvido)),
+                    resultado_ia.get("confianca_analise", 0),
+                    _as_text(resultado_ia.get("justificativa", "")),
+                    _as_text(resultado_ia.get("detalhes_ia", ""))
+                )
+            )
+    
+    def get(self, texto_decisoes: str, nome: str) -> Optional[Dict]:
+        return self.get_key(self.key(texto_decisoes, nome))
+    
+    def set(self, texto_decisoes: str, nome: str, resultado_ia: Dict):
+        self.set_key(self.key(texto_decisoes, nome), resultado_ia)
+    
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM llm_verdicts")
+
+class BatchJobStore:
+    """Jobs da OpenAI Batch API guardados em SQLite (mesmo arquivo do cache de veredictos)
+    
+    O lote roda na OpenAI por até 24h; com o job em disco ele pode ser retomado pelo ID
+    depois de fechar a aba ou reiniciar o servidor, e não só enquanto durar a sessão.
+    """
+    
+    def __init__(self, path: str = LLM_CACHE_PATH):
+        # Uma conexão compartilhada entre as sessões/threads do Streamlit, serializada pelo lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS batch_jobs (
+                    batch_id TEXT PRIMARY KEY,
+                    job TEXT,
+                    ts REAL
+                )
+            """)
+    
+    def save(self, job: Dict):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO batch_jobs VALUES (?, ?, ?)",
+                (job["batch_id"], orjson.dumps(job), time.time())
+            )
+    
+    def load(self, batch_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT job FROM batch_jobs WHERE batch_id = ?", (batch_id,)).fetchone()
+        return None if row is None else orjson.loads(row[0])
+    
+    def pending_ids(self) -> List[str]:
+        """IDs dos lotes ainda não coletados, do mais recente para o mais antigo"""
+        with self.lock:
+            rows = self.conn.execute("SELECT batch_id FROM batch_jobs ORDER BY ts DESC").fetchall()
+        return [row[0] for row in rows]
+    
+    def delete(self, batch_id: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM batch_jobs WHERE batch_id = ?", (batch_id,))
+
+class _CaseGrouper:
+    """Agrupa os casos prontos para a IA em chamadas de até `batch_size` CPFs
+    
+    Cada tarefa de CPF avisa quando sua consulta BigData termina (`submit` com o caso ou
+    `skip` sem nada para a IA); um grupo é enviado quando enche ou quando não há mais
+    consultas pendentes que possam completá-lo. No máximo `concurrency` grupos ficam em
+    análise ao mesmo tempo; os demais aguardam enquanto as consultas BigData seguem.
+    """
+    
+    def __init__(self, dispatch, batch_size: int, pending_fetches: int, concurrency: int = DEFAULT_LLM_CONCURRENCY):
+        self.dispatch = dispatch  # async (casos) -> lista de resultados da IA na mesma ordem
+        self.batch_size = batch_size
+        self.pending_fetches = pending_fetches
+        self.slots = asyncio.Semaphore(max(1, concurrency))
+        self.buffer = []
+        self.tasks = set()
+    
+    def submit(self, caso: Dict) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.buffer.append((caso, future))
+        self.pending_fetches -= 1
+        self._maybe_flush()
+        return future
+    
+    def skip(self):
+        self.pending_fetches -= 1
+        self._maybe_flush()
+    
+    def _maybe_flush(self):
+        while len(self.buffer) >= self.batch_size or (self.buffer and self.pending_fetches == 0):
+            grupo, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+            task = asyncio.create_task(self._run(grupo))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+    
+    async def _run(self, grupo):
+        try:
+            async with self.slots:
+                resultados = await self.dispatch([caso for caso, _ in grupo])
+        except Exception as e:
+            # Propagar a falha para as tarefas que aguardam este grupo
+            for _, future in grupo:
+                future.set_exception(e)
+            return
+        for (_, future), resultado_ia in zip(grupo, resultados):
+            future.set_result(resultado_ia)
+
 class BatchAbsolutionAnalyzerLLM:
     """Analisador de absolvições em lote com IA para múltiplos CPFs"""
     
-    def __init__(self, max_workers: int = 5, delay_between_requests: float = 0.3):
-        self.max_workers = max_workers  # Menos workers para não sobrecarregar a OpenAI
+    def __init__(self, max_workers: int = 5, delay_between_requests: float = 0.3,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+                 batch_size: int = 1,
+                 verdict_cache: Optional[LLMVerdictCache] = None,
+                 request_timeout: float = DEFAULT_LLM_TIMEOUT,
+                 llm_concurrency: int = DEFAULT_LLM_CONCURRENCY,
+                 response_cache: Optional[BigDataCache] = None,
+                 requests_per_second: Optional[float] = None):
+        self.max_workers = max_workers  # Consultas simultâneas à BigData
+        self.llm_concurrency = max(1, llm_concurrency)  # Chamadas simultâneas à IA
         self.delay_between_requests = delay_between_requests
+        # Ritmo global das consultas BigData no modo assíncrono (padrão: `max_workers` a cada `delay_between_requests`)
+        self.requests_per_second = requests_per_second or (
+            max_workers / delay_between_requests if delay_between_requests > 0 else None
+        )
+        self.requests_per_minute = requests_per_minute  # Orçamento da OpenAI (token bucket)
+        self.tokens_per_minute = tokens_per_minute
+        self.batch_size = max(1, batch_size)  # CPFs por chamada à IA
+        self.verdict_cache = verdict_cache  # Veredictos já obtidos (opcional)
+        self.response_cache = response_cache  # Respostas BigData já obtidas (opcional)
+        self.payload_prefix, self.payload_suffix = bigdata_payload_template(BIGDATA_DATASETS)
+        self.request_timeout = openai.Timeout(request_timeout, connect=LLM_CONNECT_TIMEOUT)
         
         # Verificar credenciais BigData
         if not bigdata_token_id or not bigdata_token_hash:
@@ -34,59 +354,102 @@ class BatchAbsolutionAnalyzerLLM:
         if not openai_api_key:
             raise ValueError("OPENAI_API_KEY não configurada no arquivo .env")
         
-        self.openai_client = openai.OpenAI(api_key=openai_api_key)
+        self.openai_client = openai.OpenAI(
+            api_key=openai_api_key,
+            timeout=self.request_timeout,
+            max_retries=LLM_MAX_RETRIES
+        )
         print("✅ LLM (OpenAI GPT-4) inicializada com sucesso!")
     
-    def fetch_single_cpf_data(self, cpf: str) -> Dict:
+    def fetch_single_cpf_data(self, cpf: str, force_refresh: bool = False) -> Dict:
         """Buscar dados de um único CPF focando em processos criminais"""
         try:
-            cpf_sanitizado = re.sub(r'\D', '', cpf)
-            if len(cpf_sanitizado) != 11:
+            cpf_sanitizado = sanitize_cpf(cpf)
+            if len(cpf_sanitizado) != 11 or not cpf_sanitizado.isascii():
                 return {"cpf": cpf, "error": "CPF inválido"}
             
+            if self.response_cache is not None and not force_refresh:
+                cached = self.response_cache.get(cpf_sanitizado, BIGDATA_DATASETS)
+                if cached is not None:
+                    return cached
+            
             # Adicionar delay para evitar rate limiting
             time.sleep(self.delay_between_requests)
             
-            headers = {
-                "Accept": "application/json",
-                "Content-Type": "application/json",
-                "AccessToken": bigdata_token_hash,
-                "TokenId": bigdata_token_id
-            }
+            payload = self.payload_prefix + cpf_sanitizado.encode() + self.payload_suffix
             
-            payload = {
-                "q": f"doc{{{cpf_sanitizado}}}",
-                "Datasets": """basic_data,
-                               processes.filter(partypolarity = PASSIVE, courttype = CRIMINAL),
-                               kyc.filter(standardized_type, standardized_sanction_type, type, sanctions_source = Conselho Nacional de Justiça)"""
-            }
-            
-            response = requests.post(
-                "https://plataforma.bigdatacorp.com.br/pessoas",
-                json=payload,
-                headers=headers,
-                timeout=30
+            # Sessão compartilhada (pool de conexões keep-alive, retries em 429/5xx)
+            response = bigdata_session.post(
+                BIGDATA_URL,
+                data=payload,
+                timeout=BIGDATA_TIMEOUT
             )
             
             response.raise_for_status()
-            return response.json()
+            bdc_data = orjson.loads(response.content)
+            if self.response_cache is not None:
+                self.response_cache.set(cpf_sanitizado, BIGDATA_DATASETS, bdc_data)
+            return bdc_data
             
         except Exception as e:
             print(f"Erro ao processar CPF {cpf}: {str(e)}")
             return {"cpf": cpf, "error": str(e)}
     
-    def analyze_with_llm(self, texto_decisoes: str, dados_pessoa: Dict) -> Dict:
-        """Analisar decisões com IA (GPT-4) para determinar absolvição"""
+    async def _fetch_single_cpf_data_async(self, session, semaphore: asyncio.Semaphore,
+                                           limiter: Optional[BigDataRateLimiter], cpf: str) -> Dict:
+        """Versão assíncrona de `fetch_single_cpf_data` sobre a sessão aiohttp compartilhada do lote"""
         try:
-            if not texto_decisoes.strip():
-                return {
-                    "foi_absolvido": None,
-                    "confianca_analise": 0,
-                    "justificativa": "Nenhuma decisão disponível para análise",
-                    "detalhes_ia": "Sem dados suficientes"
-                }
+            cpf_sanitizado = sanitize_cpf(cpf)
+            if len(cpf_sanitizado) != 11 or not cpf_sanitizado.isascii():
+                return {"cpf": cpf, "error": "CPF inválido"}
             
-            prompt = f"""
+            if self.response_cache is not None:
+                cached = self.response_cache.get(cpf_sanitizado, BIGDATA_DATASETS)
+                if cached is not None:
+                    return cached
+            
+            payload = self.payload_prefix + cpf_sanitizado.encode() + self.payload_suffix
+            
+            async with semaphore:
+                # Respeitar o ritmo global do lote para evitar rate limiting (sem bloquear o loop)
+                if limiter is not None:
+                    await limiter.acquire()
+                
+                async with session.post(BIGDATA_URL, data=payload) as response:
+                    response.raise_for_status()
+                    bdc_data = orjson.loads(await response.read())
+            
+            if self.response_cache is not None:
+                self.response_cache.set(cpf_sanitizado, BIGDATA_DATASETS, bdc_data)
+            return bdc_data
+            
+        except Exception as e:
+            print(f"Erro ao processar CPF {cpf}: {str(e)}")
+            return {"cpf": cpf, "error": str(e)}
+    
+    def _cached_verdict(self, texto_decisoes: str, nome: Optional[str] = None) -> Optional[Dict]:
+        """Veredicto da IA já em cache para o mesmo conteúdo de prompt (nome + decisões)"""
+        if self.verdict_cache is None:
+            return None
+        return self.verdict_cache.get(texto_decisoes, nome or "")
+    
+    def _store_verdict(self, resultado_ia: Dict, texto_decisoes: str, nome: Optional[str] = None):
+        """Guardar um veredicto obtido com sucesso da IA pelo conteúdo do prompt"""
+        if self.verdict_cache is not None:
+            self._store_verdict_key(LLMVerdictCache.key(texto_decisoes, nome or ""), resultado_ia)
+    
+    def _store_verdict_key(self, key: Optional[str], resultado_ia: Dict):
+        """Gravar no cache sem deixar uma falha de escrita derrubar a análise já paga"""
+        if self.verdict_cache is None or not key:
+            return
+        try:
+            self.verdict_cache.set_key(key, resultado_ia)
+        except Exception as e:
+            print(f"⚠️ Falha ao gravar veredicto no cache: {str(e)}")
+    
+    def _build_llm_request(self, texto_decisoes: str, dados_pessoa: Dict) -> Dict:
+        """Montar os parâmetros da chamada de chat completion para um CPF"""
+        prompt = f"""
 Você é um especialista jurídico. Analise as decisões judiciais abaixo e determine se a pessoa foi ABSOLVIDA em processos criminais.
 
 DADOS DA PESSOA:
@@ -110,19 +473,35 @@ RESPONDA APENAS EM JSON:
   "detalhes_ia": "Resumo dos processos relevantes"
 }}
 """
+        
+        return {
+            "model": LLM_MODEL,
+            "messages": [
+                {"role": "system", "content": LLM_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": LLM_MAX_OUTPUT_TOKENS,
+            "temperature": 0.2,
+            "response_format": {"type": "json_object"}
+        }
+    
+    def analyze_with_llm(self, texto_decisoes: str, dados_pessoa: Dict) -> Dict:
+        """Analisar decisões com IA (GPT-4) para determinar absolvição"""
+        try:
+            if not texto_decisoes.strip():
+                return {
+                    "foi_absolvido": None,
+                    "confianca_analise": 0,
+                    "justificativa": "Nenhuma decisão disponível para análise",
+                    "detalhes_ia": "Sem dados suficientes"
+                }
             
             response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Você é um analista jurídico especializado em análise de absolvições. Responda sempre em JSON válido."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=800,
-                temperature=0.2,
-                response_format={"type": "json_object"}
+                **self._build_llm_request(texto_decisoes, dados_pessoa)
             )
             
-            resultado_ia = json.loads(response.choices[0].message.content)
+            resultado_ia = orjson.loads(response.choices[0].message.content)
+            self._store_verdict(resultado_ia, texto_decisoes, dados_pessoa.get("nome"))
             return resultado_ia
             
         except Exception as e:
@@ -133,6 +512,239 @@ RESPONDA APENAS EM JSON:
                 "detalhes_ia": "Falha no processamento"
             }
     
+    def _build_group_llm_request(self, casos: List[Dict]) -> Dict:
+        """Montar uma única chamada de chat completion para vários CPFs (um item por CPF)"""
+        itens = [
+            {
+                "id": i,
+                "nome": caso["dados_pessoa"].get("nome", "Não informado"),
+                "cpf": caso["dados_pessoa"].get("cpf", "Não informado"),
+                "decisoes": caso["texto_decisoes"]
+            }
+            for i, caso in enumerate(casos, 1)
+        ]
+        prompt = f"""
+Você é um especialista jurídico. Para CADA item da lista abaixo, analise as decisões judiciais e determine se a pessoa foi ABSOLVIDA em processos criminais.
+
+INSTRUÇÃO ESPECÍFICA:
+1. Determine se houve ABSOLVIÇÃO em algum processo criminal
+2. Considere: absolvições, improcedências, arquivamentos, extinções
+3. Ignore processos onde a pessoa não seja réu/investigado
+4. Seja preciso: só retorne True se houver absolvição clara
+5. Analise cada item de forma independente
+
+ITENS:
+{orjson.dumps(itens).decode()}
+
+RESPONDA APENAS EM JSON, com um resultado por item (mesmo "id"):
+{{
+  "resultados": [
+    {{
+      "id": 1,
+      "foi_absolvido": true/false/null,
+      "confianca_analise": 0-100,
+      "justificativa": "Explicação clara da análise",
+      "detalhes_ia": "Resumo dos processos relevantes"
+    }}
+  ]
+}}
+"""
+        
+        return {
+            "model": LLM_MODEL,
+            "messages": [
+                {"role": "system", "content": LLM_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": LLM_MAX_OUTPUT_TOKENS * len(casos),
+            "temperature": 0.2,
+            "response_format": {"type": "json_object"}
+        }
+    
+    async def _complete_json_async(self, client, limiter: _RateLimiter, request: Dict) -> Dict:
+        """Executar uma chamada regulada pelo token bucket RPM/TPM e devolver o JSON da resposta"""
+        # Estimativa de tokens: ~4 caracteres por token de entrada + máximo de saída
+        estimated_tokens = sum(len(m["content"]) for m in request["messages"]) // 4 + request["max_tokens"]
+        
+        for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+            try:
+                await limiter.acquire(estimated_tokens)
+                response = await client.chat.completions.create(**request)
+                return orjson.loads(response.choices[0].message.content)
+            
+            except openai.RateLimitError as e:
+                # Esperar exatamente o reset informado pela API antes de tentar de novo
+                headers = e.response.headers
+                reset = max(
+                    _parse_rate_limit_reset(headers.get("x-ratelimit-reset-requests")) or 0,
+                    _parse_rate_limit_reset(headers.get("x-ratelimit-reset-tokens")) or 0
+                ) or 2 ** attempt
+                limiter.pause(reset)
+                if attempt == LLM_MAX_ATTEMPTS:
+                    raise
+            
+            except (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError):
+                # Chamada travada, conexão perdida ou erro 5xx da OpenAI: nova tentativa com backoff exponencial
+                if attempt == LLM_MAX_ATTEMPTS:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+    
+    async def _analyze_with_llm_async(self, client, limiter: _RateLimiter, texto_decisoes: str, dados_pessoa: Dict) -> Dict:
+        """Versão assíncrona de `analyze_with_llm`, regulada pelo token bucket RPM/TPM"""
+        if not texto_decisoes.strip():
+            return self.analyze_with_llm(texto_decisoes, dados_pessoa)
+        
+        try:
+            resultado_ia = await self._complete_json_async(
+                client, limiter, self._build_llm_request(texto_decisoes, dados_pessoa)
+            )
+        except Exception as e:
+            return {
+                "foi_absolvido": None,
+                "confianca_analise": 0,
+                "justificativa": f"Erro na análise IA: {str(e)}",
+                "detalhes_ia": "Falha no processamento"
+            }
+        
+        self._store_verdict(resultado_ia, texto_decisoes, dados_pessoa.get("nome"))
+        return resultado_ia
+    
+    async def _analyze_group_async(self, client, limiter: _RateLimiter, casos: List[Dict]) -> List[Dict]:
+        """Analisar vários CPFs numa única chamada; devolve um resultado da IA por caso, na mesma ordem"""
+        if len(casos) == 1:
+            caso = casos[0]
+            return [await self._analyze_with_llm_async(client, limiter, caso["texto_decisoes"], caso["dados_pessoa"])]
+        
+        try:
+            resposta = await self._complete_json_async(client, limiter, self._build_group_llm_request(casos))
+        except Exception as e:
+            return self._group_error(casos, e)
+        return self._split_group_response(casos, resposta)
+    
+    @staticmethod
+    def _group_error(casos: List[Dict], e: Exception) -> List[Dict]:
+        """Mesmo resultado de erro para todos os casos de uma chamada agrupada que falhou"""
+        erro = {
+            "foi_absolvido": None,
+            "confianca_analise": 0,
+            "justificativa": f"Erro na análise IA: {str(e)}",
+            "detalhes_ia": "Falha no processamento"
+        }
+        return [dict(erro) for _ in casos]
+    
+    def _split_group_response(self, casos: List[Dict], resposta: Dict) -> List[Dict]:
+        """Associar cada item da resposta agrupada ao seu caso pelo "id" (posição 1..N)"""
+        por_id = {
+            str(item.get("id")): item
+            for item in resposta.get("resultados", [])
+            if isinstance(item, dict)
+        }
+        
+        resultados = []
+        for i, caso in enumerate(casos, 1):
+            resultado_ia = por_id.get(str(i))
+            if resultado_ia is None:
+                resultado_ia = {
+                    "foi_absolvido": None,
+                    "confianca_analise": 0,
+                    "justificativa": "Erro na análise IA: item ausente na resposta agrupada",
+                    "detalhes_ia": "Falha no processamento"
+                }
+            else:
+                self._store_verdict(resultado_ia, caso["texto_decisoes"], caso["dados_pessoa"].get("nome"))
+            resultados.append(resultado_ia)
+        return resultados
+    
+    def _extract_case(self, bdc_data: Dict, cpf: str) -> Dict:
+        """Extrair nome, processos criminais como réu e texto das decisões para a IA"""
+        pessoa = bdc_data["Result"][0]
+        basic = pessoa.get("BasicData", {})
+        nome = basic.get("Name", "Nome não informado")
+        
+        processos = pessoa.get("Processes", {})
+        lawsuits = processos.get("Lawsuits", [])
+        if not lawsuits:
+            # Sem processos: texto vazio, resolvido sem chamada à IA
+            return {"nome": nome, "total_processos_criminais": 0, "texto_decisoes": ""}
+        
+        # Nome normalizado uma única vez para comparar com todas as partes
+        nome_alvo = nome.strip().upper()
+        
+        # A BigData já filtra processos criminais no polo passivo; manter só aqueles em que a pessoa é ré
+        processos_criminais = []
+        texto_completo_decisoes = []
+        
+        for proc in lawsuits:
+            # Verificar se é réu
+            partes = proc.get("Parties", [])
+            is_reu = False
+            for parte in partes:
+                papel = parte.get("Type", "").upper()
+                espec = parte.get("PartyDetails", {}).get("SpecificType", "").upper()
+                
+                if (papel in _DEFENDANT_TAGS or espec == "RÉU") and \
+                   nome_alvo in parte.get("Name", "").upper():
+                    is_reu = True
+                    break
+            
+            if is_reu:
+                processos_criminais.append(proc)
+                
+                # Coletar dados do processo para IA
+                numero_processo = proc.get("CaseNumber") or proc.get("Number", "")
+                tribunal = proc.get("CourtName", "")
+                
+                # Coletar textos relevantes
+                textos_processo = []
+                
+                # Conteúdo do processo
+                if proc.get("Content"):
+                    textos_processo.append(f"Conteúdo: {proc.get('Content')}")
+                
+                # Decisão principal
+                if proc.get("Decision"):
+                    textos_processo.append(f"Decisão: {proc.get('Decision')}")
+                
+                # Descrição
+                if proc.get("Description"):
+                    textos_processo.append(f"Descrição: {proc.get('Description')}")
+                
+                # Decisões específicas
+                decisoes = proc.get("Decisions", [])
+                for i, decisao in enumerate(decisoes):
+                    conteudo_decisao = decisao.get("DecisionContent", "")
+                    data_decisao = decisao.get("DecisionDate", "")
+                    if conteudo_decisao:
+                        textos_processo.append(f"Decisão {i+1} ({data_decisao}): {conteudo_decisao}")
+                
+                # Consolidar texto do processo
+                if textos_processo:
+                    texto_processo_completo = f"""
+PROCESSO {numero_processo} - {tribunal}:
+{chr(10).join(textos_processo)}
+---
+"""
+                    texto_completo_decisoes.append(texto_processo_completo)
+        
+        return {
+            "nome": nome,
+            "total_processos_criminais": len(processos_criminais),
+            "texto_decisoes": "\n".join(texto_completo_decisoes)
+        }
+    
+    def _compose_result(self, cpf: str, case: Dict, resultado_ia: Dict) -> Dict:
+        """Montar o resultado final de um CPF a partir do caso extraído e da resposta da IA"""
+        return {
+            "cpf": cpf,
+            "nome": case["nome"],
+            "foi_absolvido": resultado_ia.get("foi_absolvido"),
+            "confianca_analise": resultado_ia.get("confianca_analise", 0),
+            "justificativa": resultado_ia.get("justificativa", ""),
+            "detalhes_ia": resultado_ia.get("detalhes_ia", ""),
+            "total_processos_criminais": case["total_processos_criminais"],
+            "status": "sucesso"
+        }
+    
     def analyze_absolution_with_llm(self, bdc_data: Dict, cpf: str) -> Dict:
         """Analisar absolvição usando IA"""
         try:
@@ -148,92 +760,54 @@ RESPONDA APENAS EM JSON:
                     "status": "dados_nao_encontrados"
                 }
             
-            pessoa = bdc_data["Result"][0]
-            basic = pessoa.get("BasicData", {})
-            nome = basic.get("Name", "Nome não informado")
-            
-            processos = pessoa.get("Processes", {})
-            lawsuits = processos.get("Lawsuits", [])
+            case = self._extract_case(bdc_data, cpf)
             
-            # Filtrar apenas processos criminais onde a pessoa é ré
-            processos_criminais = []
-            texto_completo_decisoes = []
-            
-            for proc in lawsuits:
-                if proc.get("CourtType") == "CRIMINAL":
-                    # Verificar se é réu
-                    partes = proc.get("Parties", [])
-                    is_reu = False
-                    for parte in partes:
-                        papel = parte.get("Type", "").upper()
-                        nome_parte = parte.get("Name", "").strip().upper()
-                        espec = parte.get("PartyDetails", {}).get("SpecificType", "").upper()
-                        
-                        if (papel == "DEFENDANT" or papel == "RÉU" or espec == "RÉU") and \
-                           nome.strip().upper() in nome_parte:
-                            is_reu = True
-                            break
-                    
-                    if is_reu:
-                        processos_criminais.append(proc)
-                        
-                        # Coletar dados do processo para IA
-                        numero_processo = proc.get("CaseNumber") or proc.get("Number", "")
-                        tribunal = proc.get("CourtName", "")
-                        
-                        # Coletar textos relevantes
-                        textos_processo = []
-                        
-                        # Conteúdo do processo
-                        if proc.get("Content"):
-                            textos_processo.append(f"Conteúdo: {proc.get('Content')}")
-                        
-                        # Decisão principal
-                        if proc.get("Decision"):
-                            textos_processo.append(f"Decisão: {proc.get('Decision')}")
-                        
-                        # Descrição
-                        if proc.get("Description"):
-                            textos_processo.append(f"Descrição: {proc.get('Description')}")
-                        
-                        # Decisões específicas
-                        decisoes = proc.get("Decisions", [])
-                        for i, decisao in enumerate(decisoes):
-                            conteudo_decisao = decisao.get("DecisionContent", "")
-                            data_decisao = decisao.get("DecisionDate", "")
-                            if conteudo_decisao:
-                                textos_processo.append(f"Decisão {i+1} ({data_decisao}): {conteudo_decisao}")
-                        
-                        # Consolidar texto do processo
-                        if textos_processo:
-                            texto_processo_completo = f"""
-PROCESSO {numero_processo} - {tribunal}:
-{chr(10).join(textos_processo)}
----
-"""
-                            texto_completo_decisoes.append(texto_processo_completo)
-            
-            total_processos = len(processos_criminais)
-            
-            # Analisar com IA
-            texto_para_ia = "\n".join(texto_completo_decisoes)
-            dados_pessoa = {"nome": nome, "cpf": cpf}
+            # Analisar com IA (ou reaproveitar o veredicto em cache)
+            dados_pessoa = {"nome": case["nome"], "cpf": cpf}
+            resultado_ia = (
+                self._cached_verdict(case["texto_decisoes"], case["nome"])
+                or self.analyze_with_llm(case["texto_decisoes"], dados_pessoa)
+            )
             
-            resultado_ia = self.analyze_with_llm(texto_para_ia, dados_pessoa)
+            return self._compose_result(cpf, case, resultado_ia)
             
+        except Exception as e:
             return {
                 "cpf": cpf,
-                "nome": nome,
-                "foi_absolvido": resultado_ia.get("foi_absolvido"),
-                "confianca_analise": resultado_ia.get("confianca_analise", 0),
-                "justificativa": resultado_ia.get("justificativa", ""),
-                "detalhes_ia": resultado_ia.get("detalhes_ia", ""),
-                "total_processos_criminais": total_processos,
-                "status": "sucesso"
+                "nome": "Erro no processamento",
+                "foi_absolvido": None,
+                "confianca_analise": 0,
+                "justificativa": f"Erro durante processamento: {str(e)}",
+                "detalhes_ia": "Falha na análise",
+                "total_processos_criminais": 0,
+                "status": f"erro: {str(e)}"
             }
-            
+    
+    def _prepare_context(self, cpf: str, bdc_data: Dict) -> Dict:
+        """Resolver na hora os CPFs que não precisam da IA; os demais viram um caso pronto para o prompt
+        
+        Retorna `{"cpf", "result"}` (resultado final) ou `{"cpf", "case", "texto_decisoes", "dados_pessoa"}`.
+        """
+        if "error" in bdc_data:
+            return {"cpf": cpf, "result": {
+                "cpf": cpf,
+                "nome": "Erro na consulta",
+                "foi_absolvido": None,
+                "confianca_analise": 0,
+                "justificativa": f"Erro na API: {bdc_data['error']}",
+                "detalhes_ia": "Falha na consulta de dados",
+                "total_processos_criminais": 0,
+                "status": f"erro_api: {bdc_data['error']}"
+            }}
+        
+        if "Result" not in bdc_data or not bdc_data["Result"]:
+            # Retorna "dados_nao_encontrados" sem chamar a IA
+            return {"cpf": cpf, "result": self.analyze_absolution_with_llm(bdc_data, cpf)}
+        
+        try:
+            case = self._extract_case(bdc_data, cpf)
         except Exception as e:
-            return {
+            return {"cpf": cpf, "result": {
                 "cpf": cpf,
                 "nome": "Erro no processamento",
                 "foi_absolvido": None,
@@ -242,96 +816,276 @@ PROCESSO {numero_processo} - {tribunal}:
                 "detalhes_ia": "Falha na análise",
                 "total_processos_criminais": 0,
                 "status": f"erro: {str(e)}"
+            }}
+        
+        dados_pessoa = {"nome": case["nome"], "cpf": cpf}
+        if not case["texto_decisoes"].strip():
+            # Sem decisões: analyze_with_llm responde sem chamar a API
+            return {"cpf": cpf, "result": self._compose_result(cpf, case, self.analyze_with_llm("", dados_pessoa))}
+        
+        resultado_ia = self._cached_verdict(case["texto_decisoes"], case["nome"])
+        if resultado_ia is not None:
+            return {"cpf": cpf, "result": self._compose_result(cpf, case, resultado_ia)}
+        
+        return {"cpf": cpf, "case": case, "texto_decisoes": case["texto_decisoes"], "dados_pessoa": dados_pessoa}
+    
+    def fetch_contexts(self, cpfs: List[str]) -> List[Dict]:
+        """Consultar a BigData em paralelo e preparar o contexto de cada CPF (sem IA), na ordem recebida"""
+        return asyncio.run(self._fetch_contexts_async(cpfs))
+    
+    async def _fetch_contexts_async(self, cpfs: List[str]) -> List[Dict]:
+        semaphore = asyncio.Semaphore(self.max_workers)
+        limiter = BigDataRateLimiter(self.requests_per_second) if self.requests_per_second else None
+        
+        async with bigdata_async_session(self.max_workers) as session:
+            fetched = await asyncio.gather(*(
+                self._fetch_single_cpf_data_async(session, semaphore, limiter, cpf) for cpf in cpfs
+            ))
+        return [self._prepare_context(cpf, bdc_data) for cpf, bdc_data in zip(cpfs, fetched)]
+    
+    async def _analyze_cpf_async(self, cpf: str, session, fetch_semaphore: asyncio.Semaphore,
+                                 fetch_limiter: Optional[BigDataRateLimiter], grouper: _CaseGrouper) -> Dict:
+        """Buscar (BigData) e analisar (IA, via grupo de CPFs) um CPF dentro do loop assíncrono"""
+        submitted = False
+        try:
+            # Consulta BigData como tarefa do loop (sem threads), limitada a max_workers
+            bdc_data = await self._fetch_single_cpf_data_async(session, fetch_semaphore, fetch_limiter, cpf)
+            
+            context = self._prepare_context(cpf, bdc_data)
+            if "result" in context:
+                return context["result"]
+            
+            future = grouper.submit(context)
+            submitted = True
+            resultado_ia = await future
+            return self._compose_result(cpf, context["case"], resultado_ia)
+        
+        except Exception as exc:
+            print(f'CPF {cpf} gerou exceção: {exc}')
+            return {
+                "cpf": cpf,
+                "nome": "Erro na consulta",
+                "foi_absolvido": None,
+                "confianca_analise": 0,
+                "justificativa": f"Exceção durante processamento: {str(exc)}",
+                "detalhes_ia": "Falha no processamento",
+                "total_processos_criminais": 0,
+                "status": f"excecao: {str(exc)}"
             }
+        
+        finally:
+            if not submitted:
+                grouper.skip()
     
-    def process_batch(self, cpfs: List[str], progress_callback=None) -> List[Dict]:
-        """Processar lista de CPFs em lote com análise IA"""
+    async def _process_batch_async(self, cpfs: List[str], progress_callback=None) -> List[Dict]:
         results = []
         total = len(cpfs)
         
-        print(f"🧠 Iniciando processamento INTELIGENTE em lote de {total} CPFs...")
-        print("⚡ Usando GPT-4 para análise contextual das decisões")
+        limiter = _RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+        fetch_semaphore = asyncio.Semaphore(self.max_workers)
+        fetch_limiter = BigDataRateLimiter(self.requests_per_second) if self.requests_per_second else None
+        
+        # Lotes menores que o número de workers não ganham nada com o agrupamento
+        batch_size = self.batch_size if total >= self.max_workers else 1
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submeter todas as tarefas
-            future_to_cpf = {executor.submit(self.fetch_single_cpf_data, cpf): cpf for cpf in cpfs}
+        # Um único cliente assíncrono (pool de conexões compartilhado) por lote; retries tratados
+        # aqui (LLM_MAX_ATTEMPTS) para respeitar os cabeçalhos de reset do rate limit.
+        # A sessão aiohttp da BigData também é única por lote.
+        async with bigdata_async_session(self.max_workers) as session, \
+                openai.AsyncOpenAI(api_key=openai_api_key, timeout=self.request_timeout, max_retries=0) as client:
+            grouper = _CaseGrouper(
+                lambda casos: self._analyze_group_async(client, limiter, casos),
+                batch_size,
+                total,
+                self.llm_concurrency
+            )
+            tasks = [
+                asyncio.create_task(self._analyze_cpf_async(cpf, session, fetch_semaphore, fetch_limiter, grouper))
+                for cpf in cpfs
+            ]
             
-            for i, future in enumerate(as_completed(future_to_cpf), 1):
-                cpf = future_to_cpf[future]
-                try:
-                    bdc_data = future.result()
-                    
-                    # Analisar com IA
-                    if "error" in bdc_data:
-                        result = {
-                            "cpf": cpf,
-                            "nome": "Erro na consulta",
-                            "foi_absolvido": None,
-                            "confianca_analise": 0,
-                            "justificativa": f"Erro na API: {bdc_data['error']}",
-                            "detalhes_ia": "Falha na consulta de dados",
-                            "total_processos_criminais": 0,
-                            "status": f"erro_api: {bdc_data['error']}"
-                        }
-                    else:
-                        result = self.analyze_absolution_with_llm(bdc_data, cpf)
-                    
-                    results.append(result)
-                    
-                    # Callback de progresso
-                    if progress_callback:
-                        progress_callback(i, total, result)
-                    
-                    # Log de progresso
-                    if i % 5 == 0 or i == total:
-                        print(f"🤖 Processados com IA: {i}/{total} CPFs ({i/total*100:.1f}%)")
+            for i, task in enumerate(asyncio.as_completed(tasks), 1):
+                result = await task
+                results.append(result)
+                
+                # Callback de progresso
+                if progress_callback:
+                    progress_callback(i, total, result)
                 
-                except Exception as exc:
-                    print(f'CPF {cpf} gerou exceção: {exc}')
-                    results.append({
-                        "cpf": cpf,
-                        "nome": "Erro na consulta",
-                        "foi_absolvido": None,
-                        "confianca_analise": 0,
-                        "justificativa": f"Exceção durante processamento: {str(exc)}",
-                        "detalhes_ia": "Falha no processamento",
-                        "total_processos_criminais": 0,
-                        "status": f"excecao: {str(exc)}"
-                    })
+                # Log de progresso
+                if i % 5 == 0 or i == total:
+                    print(f"🤖 Processados com IA: {i}/{total} CPFs ({i/total*100:.1f}%)")
+        
+        return results
+    
+    def process_batch(self, cpfs: List[str], progress_callback=None) -> List[Dict]:
+        """Processar lista de CPFs em lote com análise IA"""
+        print(f"🧠 Iniciando processamento INTELIGENTE em lote de {len(cpfs)} CPFs...")
+        print(f"⚡ Usando GPT-4 para análise contextual das decisões (até {self.requests_per_minute:.0f} RPM / {self.tokens_per_minute:.0f} TPM, {self.batch_size} CPFs por chamada)")
+        
+        return asyncio.run(self._process_batch_async(cpfs, progress_callback))
+    
+    def submit_batch_offline(self, cpfs: List[str]) -> Dict:
+        """Buscar os dados dos CPFs e enviar as análises para a OpenAI Batch API (janela de 24h, 50% mais barata)
+        
+        Retorna um job serializável (guardar no `BatchJobStore`) para acompanhar com `check_batch_offline`.
+        CPFs sem dados ou sem decisões são resolvidos na hora, sem entrar no lote.
+        """
+        total = len(cpfs)
+        print(f"🧠 Preparando lote OFFLINE (Batch API) de {total} CPFs...")
+        
+        # Consultar BigData em paralelo (mesma etapa do processamento online)
+        contexts = self.fetch_contexts(cpfs)
+        
+        resolved = {}  # índice -> resultado final (sem chamada à IA)
+        pending = {}   # custom_id -> dados do caso para montar o resultado
+        jsonl_lines = []
+        
+        for i, context in enumerate(contexts):
+            if "result" in context:
+                resolved[str(i)] = context["result"]
+                continue
+            
+            cpf, case = context["cpf"], context["case"]
+            pending[str(i)] = {
+                "cpf": cpf, "nome": case["nome"], "total_processos_criminais": case["total_processos_criminais"],
+                # Só a chave do veredicto (não o texto das decisões) para manter o job pequeno
+                "verdict_key": LLMVerdictCache.key(context["texto_decisoes"], case["nome"])
+            }
+            jsonl_lines.append(orjson.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._build_llm_request(context["texto_decisoes"], context["dados_pessoa"])
+            }))
+        
+        job = {"batch_id": None, "total": total, "resolved": resolved, "pending": pending}
+        if not jsonl_lines:
+            return job
+        
+        # Enviar arquivo JSONL e criar o lote
+        batch_file = self.openai_client.files.create(
+            file=("themis_batch.jsonl", b"\n".join(jsonl_lines)),
+            purpose="batch"
+        )
+        batch = self.openai_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        job["batch_id"] = batch.id
+        print(f"📤 Lote {batch.id} enviado com {len(jsonl_lines)} análises IA")
+        return job
+    
+    def check_batch_offline(self, job: Dict, progress_callback=None) -> Optional[List[Dict]]:
+        """Consultar uma única vez o status do lote; resultados na ordem original se já terminou, senão None
+        
+        `progress_callback(concluidos, total, status_lote)` recebe o andamento consultado.
+        """
+        if not job["batch_id"]:
+            return self._assemble_batch_results(job, None)
+        
+        batch = self.openai_client.batches.retrieve(job["batch_id"])
+        if batch.status not in BATCH_TERMINAL_STATUSES:
+            if progress_callback:
+                counts = batch.request_counts
+                progress_callback(counts.completed if counts else 0, len(job["pending"]), batch.status)
+            return None
+        
+        if progress_callback:
+            progress_callback(len(job["pending"]), len(job["pending"]), batch.status)
+        return self._assemble_batch_results(job, batch)
+    
+    def collect_batch_offline(self, job: Dict, progress_callback=None, poll_interval: float = 30.0) -> List[Dict]:
+        """Acompanhar um lote da Batch API até terminar (bloqueante, para uso fora do Streamlit)"""
+        while True:
+            results = self.check_batch_offline(job, progress_callback)
+            if results is not None:
+                return results
+            time.sleep(poll_interval)
+    
+    def _assemble_batch_results(self, job: Dict, batch) -> List[Dict]:
+        """Baixar as respostas de um lote terminado e montar os resultados na ordem original"""
+        outputs = {}
+        
+        # Lotes expirados/cancelados podem ter saída parcial
+        if batch is not None:
+            if batch.output_file_id:
+                content = self.openai_client.files.content(batch.output_file_id).text
+                for line in content.splitlines():
+                    if line.strip():
+                        item = orjson.loads(line)
+                        outputs[item["custom_id"]] = item
+            print(f"📥 Lote {batch.id} finalizado ({batch.status}): {len(outputs)} respostas")
+        
+        results = []
+        for i in range(job["total"]):
+            key = str(i)
+            if key in job["resolved"]:
+                results.append(job["resolved"][key])
+                continue
+            
+            case = job["pending"][key]
+            item = outputs.get(key)
+            try:
+                if item is None or item.get("error") or item["response"]["status_code"] != 200:
+                    raise ValueError((item or {}).get("error") or f"sem resposta no lote (status: {batch.status})")
+                content = item["response"]["body"]["choices"][0]["message"]["content"]
+                resultado_ia = orjson.loads(content)
+                self._store_verdict_key(case.get("verdict_key"), resultado_ia)
+            except Exception as e:
+                resultado_ia = {
+                    "foi_absolvido": None,
+                    "confianca_analise": 0,
+                    "justificativa": f"Erro na análise IA: {str(e)}",
+                    "detalhes_ia": "Falha no processamento"
+                }
+            results.append(self._compose_result(case["cpf"], case, resultado_ia))
         
         return results
     
+    def process_batch_offline(self, cpfs: List[str], progress_callback=None, poll_interval: float = 30.0) -> List[Dict]:
+        """Processar lista de CPFs pela OpenAI Batch API (envio + acompanhamento)"""
+        job = self.submit_batch_offline(cpfs)
+        return self.collect_batch_offline(job, progress_callback=progress_callback, poll_interval=poll_interval)
+    
     def export_to_csv(self, results: List[Dict], filename: str = "analise_absolvicoes_llm.csv"):
         """Exportar resultados para CSV com dados da IA"""
-        # Dados para CSV com colunas extras da IA
-        csv_data = []
-        for result in results:
-            csv_data.append({
-                "CPF": result["cpf"],
-                "Nome": result["nome"],
-                "Foi_Absolvido": result["foi_absolvido"],
-                "Confianca_Analise": result.get("confianca_analise", 0),
-                "Justificativa_IA": result.get("justificativa", ""),
-                "Detalhes_IA": result.get("detalhes_ia", ""),
-                "Total_Processos_Criminais": result["total_processos_criminais"],
-                "Status": result["status"]
-            })
-        
-        df = pd.DataFrame(csv_data)
-        df.to_csv(filename, index=False, encoding='utf-8-sig')
+        # Colunas extras da IA, já com tipos compactos (confiança UInt8, veredicto booleano)
+        csv_df = results_to_frame(results).rename(columns={
+            "cpf": "CPF",
+            "nome": "Nome",
+            "foi_absolvido": "Foi_Absolvido",
+            "confianca_analise": "Confianca_Analise",
+            "justificativa": "Justificativa_IA",
+            "detalhes_ia": "Detalhes_IA",
+            "total_processos_criminais": "Total_Processos_Criminais",
+            "status": "Status"
+        })
+        
+        for coluna in LLM_CSV_TEXT_COLUMNS:
+            csv_df[coluna] = csv_df[coluna].map(_as_text).astype("string")
+        
+        # Escrita colunar pelo Arrow (C++), com BOM UTF-8 para abrir corretamente no Excel
+        table = pa.Table.from_pandas(csv_df[LLM_CSV_SCHEMA.names], schema=LLM_CSV_SCHEMA, preserve_index=False)
+        with open(filename, "wb") as f:
+            f.write(codecs.BOM_UTF8)
+            pacsv.write_csv(table, f)
         print(f"Resultados da análise IA exportados para: {filename}")
         return filename
     
-    def get_summary_stats(self, results: List[Dict]) -> Dict:
-        """Obter estatísticas resumidas dos resultados com dados da IA"""
-        total = len(results)
-        absolvidos = sum(1 for r in results if r["foi_absolvido"] is True)
-        nao_absolvidos = sum(1 for r in results if r["foi_absolvido"] is False)
-        sem_dados = sum(1 for r in results if r["foi_absolvido"] is None)
+    @staticmethod
+    def get_summary_stats(results) -> Dict:
+        """Obter estatísticas resumidas dos resultados com dados da IA (lista de dicts ou DataFrame)"""
+        df = results if isinstance(results, pd.DataFrame) else results_to_frame(results)
+        total = len(df)
+        absolvidos = int(df["foi_absolvido"].eq(True).sum())
+        nao_absolvidos = int(df["foi_absolvido"].eq(False).sum())
+        sem_dados = int(df["foi_absolvido"].isna().sum())
         
         # Estatísticas de confiança da IA
-        confiancas = [r.get("confianca_analise", 0) for r in results if r.get("confianca_analise") is not None]
-        confianca_media = sum(confiancas) / len(confiancas) if confiancas else 0
+        confiancas = df["confianca_analise"]
+        confianca_media = float(confiancas.mean()) if confiancas.notna().any() else 0
         
         return {
             "total_processados": total,
@@ -342,8 +1096,8 @@ PROCESSO {numero_processo} - {tribunal}:
             "percentual_nao_absolvidos": (nao_absolvidos / total * 100) if total > 0 else 0,
             "percentual_sem_dados": (sem_dados / total * 100) if total > 0 else 0,
             "confianca_media_ia": confianca_media,
-            "analises_com_alta_confianca": sum(1 for c in confiancas if c >= 80),
-            "analises_com_baixa_confianca": sum(1 for c in confiancas if c < 50)
+            "analises_com_alta_confianca": int((confiancas >= 80).sum()),
+            "analises_com_baixa_confianca": int((confiancas < 50).sum())
         }
 
 # Função para teste
@@ -373,7 +1127,7 @@ if __name__ == "__main__":
     # Estatísticas
     stats = analyzer.get_summary_stats(results)
     print("\n📊 ESTATÍSTICAS IA:")
-    print(json.dumps(stats, indent=2, ensure_ascii=False))
+    print(orjson.dumps(stats, option=orjson.OPT_INDENT_2).decode())
     
     # Exportar para CSV
     analyzer.export_to_csv(results, "teste_absolvicoes_llm.csv")